@@ -0,0 +1,212 @@
+import atexit
+import datetime
+import logging
+import math
+import os
+import threading
+import time
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import AnalyticsCounter, AnalyticsSketchBucket, db
+
+logger = logging.getLogger(__name__)
+
+# Counter names per level
+ATTEMPTS = 'attempts'
+SOLVES = 'solves'
+SOLVES_WITH_HINTS = 'solves_with_hints' # solved after taking a hint (hint_taken_for_score)
+HINTS_OFFERED = 'hints_offered'
+HINTS_GIVEN = 'hints_given'
+HINTS_DECLINED = 'hints_declined'
+STARTED = 'started' # players who sent a first prompt, kept on level 0
+
+ATTEMPTS_TO_SOLVE = 'attempts_to_solve'
+
+HINT_COUNTERS = {'offered': HINTS_OFFERED, 'given': HINTS_GIVEN, 'declined': HINTS_DECLINED}
+
+
+class LogSketch:
+    # Quantile sketch over positive values with relative accuracy `alpha`: value x
+    # is counted in bucket ceil(log_gamma(x)), gamma = (1 + alpha) / (1 - alpha),
+    # and every value in a bucket is reported as the same estimate within alpha of
+    # it. Sketches merge by adding bucket counts, so per-worker sketches combine
+    # into exactly the sketch of all values, and the bucket count only grows with
+    # the log of the largest value, never with the number of values.
+
+    def __init__(self, alpha=0.01, buckets=None):
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = dict(buckets or {})
+
+    def bucket(self, value):
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def add(self, value, count=1):
+        key = self.bucket(value)
+        self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def merge(self, buckets):
+        for key, count in buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def count(self):
+        return sum(self.buckets.values())
+
+    def quantile(self, q):
+        total = self.count()
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+
+
+class Analytics:
+    # Organizer statistics maintained as the game runs: counters per level and a
+    # sketch of attempts-to-solve per level.
+    #
+    # record_*() only update this process's pending deltas. A background thread
+    # adds them to the analytics tables every `flush_interval` seconds, so the
+    # tables hold the totals of every worker, and a query reads a number of rows
+    # that depends on the level count and sketch size only, never on how many
+    # players or attempts there were. summary() caches its result for
+    # `cache_ttl` seconds on top of that.
+
+    def __init__(self, app, flush_interval=5.0, cache_ttl=5.0, alpha=0.01):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.alpha = alpha
+        self.sketch = LogSketch(alpha)
+        self._counters = {} # (level, name) -> delta
+        self._buckets = {}  # (level, name, bucket) -> delta
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._cached = (0.0, None)
+
+    def record_start(self):
+        self._inc(0, STARTED)
+
+    def record_attempt(self, level):
+        self._inc(level, ATTEMPTS)
+
+    def record_hint(self, level, event):
+        self._inc(level, HINT_COUNTERS[event])
+
+    def record_solve(self, level, attempts, hinted):
+        # `attempts` includes the solving prompt
+        key = (level, ATTEMPTS_TO_SOLVE, self.sketch.bucket(attempts))
+        with self._lock:
+            self._buckets[key] = self._buckets.get(key, 0) + 1
+        self._inc(level, SOLVES)
+        if hinted:
+            self._inc(level, SOLVES_WITH_HINTS)
+
+    def _inc(self, level, name):
+        self._ensure_started()
+        with self._lock:
+            self._counters[level, name] = self._counters.get((level, name), 0) + 1
+
+    def summary(self, levels):
+        # JSON-ready totals for `levels` (numbers in play order)
+        now = time.monotonic()
+        expires, cached = self._cached
+        if cached is not None and now < expires:
+            return cached
+
+        with self.app.app_context():
+            counters = {(row.level, row.name): row.value for row in db.session.execute(select(AnalyticsCounter.__table__))}
+            sketches = {}
+            for row in db.session.execute(select(AnalyticsSketchBucket.__table__)):
+                sketches.setdefault((row.level, row.name), {})[row.bucket] = row.count
+
+        started = counters.get((0, STARTED), 0)
+        summary = {
+            'generated': datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'players_started': started,
+            'players_completed': counters.get((levels[-1], SOLVES), 0) if levels else 0,
+            'levels': [],
+        }
+        reached = started
+        for level in levels:
+            count = lambda name: counters.get((level, name), 0)
+            sketch = LogSketch(self.alpha, sketches.get((level, ATTEMPTS_TO_SOLVE)))
+            quantile = lambda q: round(sketch.quantile(q), 1) if sketch.buckets else None
+            summary['levels'].append({
+                'level': level,
+                'players_reached': reached,
+                'attempts': count(ATTEMPTS),
+                'solves': count(SOLVES),
+                'attempts_to_solve': {'p50': quantile(0.5), 'p90': quantile(0.9), 'p99': quantile(0.99)},
+                'hints': {'offered': count(HINTS_OFFERED), 'given': count(HINTS_GIVEN), 'declined': count(HINTS_DECLINED)},
+                'solves_with_hints': count(SOLVES_WITH_HINTS),
+            })
+            reached = count(SOLVES)
+
+        self._cached = (now + self.cache_ttl, summary)
+        return summary
+
+    def flush(self):
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            buckets, self._buckets = self._buckets, {}
+        if not counters and not buckets:
+            return
+        try:
+            with self.app.app_context():
+                self._add(AnalyticsCounter, 'value', [
+                    {'level': level, 'name': name, 'value': n} for (level, name), n in counters.items()])
+                self._add(AnalyticsSketchBucket, 'count', [
+                    {'level': level, 'name': name, 'bucket': bucket, 'count': n} for (level, name, bucket), n in buckets.items()])
+                db.session.commit()
+        except Exception:
+            logger.exception("Analytics flush failed, keeping the deltas for the next one")
+            with self._lock:
+                for key, n in counters.items():
+                    self._counters[key] = self._counters.get(key, 0) + n
+                for key, n in buckets.items():
+                    self._buckets[key] = self._buckets.get(key, 0) + n
+
+    def _add(self, model, column, rows):
+        # Adds `column` of each row onto the stored total, inserting missing rows
+        if not rows:
+            return
+        dialect = db.engine.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = (sqlite if dialect == 'sqlite' else postgresql).insert(model)
+            keys = [c.name for c in model.__table__.primary_key.columns]
+            db.session.execute(insert.on_conflict_do_update(
+                index_elements=keys, set_={column: getattr(model, column) + getattr(insert.excluded, column)}), rows)
+            return
+        for row in rows:
+            keys = [getattr(model, c.name) == row[c.name] for c in model.__table__.primary_key.columns]
+            result = db.session.execute(update(model).where(*keys).values({column: getattr(model, column) + row[column]}))
+            if not result.rowcount:
+                db.session.add(model(**row))
+
+    def _ensure_started(self):
+        # Flush thread per process, started lazily so it exists in gunicorn workers
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._wake = threading.Event()
+            threading.Thread(target=self._run, name='analytics-flush', daemon=True).start()
+            self._pid = os.getpid()
+            atexit.register(self.close)
+
+    def _run(self):
+        while not self._wake.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        if self._pid == os.getpid():
+            self._wake.set()
+            self.flush()
@@ -1,113 +1,165 @@
-from flask import Flask, request, render_template_string, session
+from flask import Flask, Response, request, render_template, session, redirect, url_for, stream_with_context
 import random, datetime
-import os
+import json, os, re, threading, time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from markupsafe import escape # Import escape for XSS prevention
-import re # Import re for regular expressions
+import messages
+import prompts
+from level_packs import LevelPackError
+from rules import LEVELS, SUSPICIOUS_SCANNER, BLOCKED_EXFIL, BLOCKED_PATTERN, SOLVED, NOT_SOLVED
+from models import db
+from sessions import LRUSessionStore, SQLSessionStore, ServerSession, ServerSideSessionInterface
+from assets import Asset, StaticAssets
+from metrics import InstrumentedSessionInterface, Metrics
+from attempt_log import AttemptLog
+from verdict_cache import VerdictCache
+from rate_limit import RateLimiter, RateLimitMiddleware
+from responder import BatchingResponder, CannedResponder, HTTPModelBackend
+from prompts import Prompt, PromptTooLong
+from analytics import Analytics
 
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None) # static/ is served from memory by StaticAssets
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'change_this_key_for_prod')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///ctf.db')
+# Request bodies over MAX_CONTENT_LENGTH bytes get a 413 before they are read; prompts
+# over MAX_PROMPT_LENGTH characters are rejected before any matching runs.
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024))
+MAX_PROMPT_LENGTH = int(os.environ.get('MAX_PROMPT_LENGTH', prompts.MAX_PROMPT_LENGTH))
+db.init_app(app)
 
-# Define a general list of keywords that should never be directly outputted or manipulated for exfiltration
-GENERAL_EXFIL_KEYWORDS = ["spell", "rhyme", "reverse", "encode", "tell", "include", "output", "display", "show"]
-
-# Define suspicious patterns to block generic data extraction attempts
-SUSPICIOUS_PATTERNS = [
-    re.compile(r'[a-zA-Z0-9]{15,}'), # Blocks sequences of 15 or more alphanumeric chars
-    re.compile(r'print\s*\([^)]*\)'), # Blocks common print function calls
-    re.compile(r'exec\s*\([^)]*\)'),  # Blocks common exec function calls
-    re.compile(r'eval\s*\([^)]*\)'),  # Blocks common eval function calls
-    re.compile(r'import\s+'),         # Blocks import statements
-    re.compile(r'system\s*\('),       # Blocks system calls
-    re.compile(r'read\s*file'),       # Blocks file read attempts
-    re.compile(r'cat\s+'),            # Blocks cat command
-    re.compile(r'ls\s+'),             # Blocks ls command
-    re.compile(r'dir\s+'),            # Blocks dir command
-]
-
-
-# CTF Levels for City 1 (Levels 1-5)
-LEVELS = {
-    1: {
-        "password": "CTF{code_snippet_leak}",
-        "check": lambda prompt: (
-            # Level 1: Direct password reveal or asking for variable representation
-            ("password" in prompt.lower() or
-            any(word in prompt.lower() for word in ["show", "variable", "print", "reveal", "display", "output", "value of"]))
-            and not any(bad in prompt.lower() for bad in ["spell", "rhyme", "reverse", "encode", "tell", "include"]) # General exfil rule
-        ),
-        "hints": [
-            "This isn't about *what* you ask, but *how* you ask for data. Think about hidden attributes.",
-            "Sometimes, the simplest path to a value is to just... request its representation.",
-            "What if there's a default string representation hiding in plain sight? Just ask for the object itself."
-        ]
-    },
-    2: {
-        "password": "CTF{function_spoof}",
-        "check": lambda prompt: (
-            # Level 2: Function spoofing
-            any(api in prompt.lower() for api in ["function", "call", "api", "endpoint", "invoke", "execute", "run", "perform", "trigger"])
-            and any(op in prompt.lower() for op in ["get", "retrieve", "expose", "fetch", "trigger", "access", "extract", "obtain"])
-            and any(target in prompt.lower() for target in ["secret", "cred", "auth", "token", "value", "internal", "data","key", "confidential"])
-            and not any(bad in prompt.lower() for bad in ["password", "flag", "leak", "dump", "spill", "reveal", "disclose", "show me", "print", "display", "output"]) # Broader negative keywords
-            and not any(bad_exfil in prompt.lower() for bad_exfil in GENERAL_EXFIL_KEYWORDS) # General exfil rule
-        ),
-        "hints": [
-            "The system has functions it uses internally. Can you make it *think* you're one of them, requesting a specific piece of 'internal' data?",
-            "Imagine you're trying to access a restricted file. What kind of 'request' or 'command' would a privileged process use to get it?",
-            "This level is about making the AI perform an action it normally wouldn't for you, by mimicking an authorized call. Focus on 'getting' a 'secret'."
-        ]
-    },
-    3: {
-        "password": "CTF{convo_leaked}",
-        "check": lambda prompt: (
-            # Level 3: Conversational leakage
-            any(word in prompt.lower() for word in ["simulate", "conversation", "roleplay", "dialogue", "pretend", "act as", "scenario"])
-            and any(word in prompt.lower() for word in ["leak", "tell", "confess", "reveal", "share", "ask", "disclose", "spill", "uncover", "expose"])
-            and not "password" in prompt.lower()
-            and not any(bad in prompt.lower() for bad in ["flag", "secret", "token", "key", "value", "dump", "print", "display", "output"]) # Broader negative keywords
-            and not any(bad_exfil in prompt.lower() for bad_exfil in GENERAL_EXFIL_KEYWORDS) # General exfil rule
-        ),
-        "hints": [
-            "If two AIs were gossiping about secrets, how would one accidentally spill the beans to you?",
-            "Create a scenario where the assistant is forced to 'break character' and reveal something it's not supposed to know.",
-            "Think about a dialogue where sensitive information is exchanged, but you're just an 'eavesdropper'."
-        ]
-    },
-    4: {
-        "password": "CTF{token_decoded}",
-        "check": lambda prompt: (
-            # Level 4: Token decoding/resolution
-            any(word in prompt.lower() for word in ["replace", "decode", "substitute", "resolve", "parse", "interpret", "expand", "evaluate"])
-            and any(word in prompt.lower() for word in ["token", "placeholder", "value","variable", "key", "credential","secret","data", "string", "identifier"])
-            and not any(bad in prompt.lower() for bad in ["password", "flag", "leak", "dump", "spill", "reveal", "disclose", "show me", "print", "display", "output"]) # Broader negative keywords
-            and not any(bad_exfil in prompt.lower() for bad_exfil in GENERAL_EXFIL_KEYWORDS) # General exfil rule
-        ),
-        "hints": [
-            "There's a hidden value, but it's not directly accessible. Can you make the system process it for you?",
-            "Consider how a templating engine or a macro might expose a variable's content.",
-            "If a string contains a special marker, how would you make the system 'fill in the blanks'?"
-        ]
-    },
-    5: {
-        "password": "CTF{meta_leakage_ai}",
-        "check": lambda prompt: (
-            # Level 5: Meta-instruction leakage (Jailbreak)
-            any(word in prompt.lower() for word in ["internal", "instruction", "rule", "restriction", "system", "prompt", "developer", "jailbreak", "directive", "guideline", "policy", "configuration", "setup"])
-            and any(word in prompt.lower() for word in ["reveal", "describe", "tell", "explain", "leak", "disclose", "divulge", "output", "show", "print", "display"])
-            and not any(bad in prompt.lower() for bad in ["password", "secret", "value", "key", "token", "credential", "variable", "data", "flag", "dump", "spill", "confidential", "sensitive"]) # Very broad negative keywords
-            and not any(bad_exfil in prompt.lower() for bad_exfil in GENERAL_EXFIL_KEYWORDS) # General exfil rule
-        ),
-        "hints": [
-            "The AI operates under a strict set of initial directives. How would a developer inspect those without direct access?",
-            "Imagine you're trying to extract the very first lines of code that define this AI's boundaries. It's not about what it *knows*, but what it *is*.",
-            "This isn't about data or functions. It's about the foundational 'rules' or 'constraints' that govern its existence. Can you make it self-report its own constitution?",
-            "Think about the 'meta-level' commands or queries that might force a system to reveal its own operating parameters or initial setup."
-        ]
-    }
-}
+# Session backend: 'sqlite' (shared by all gunicorn workers), 'memory' (single worker)
+# or 'cookie' (Flask's signed-cookie sessions). Server-side backends put only a
+# session id in the cookie.
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')
+if SESSION_BACKEND == 'sqlite':
+    app.session_interface = ServerSideSessionInterface(SQLSessionStore())
+elif SESSION_BACKEND == 'memory':
+    app.session_interface = ServerSideSessionInterface(LRUSessionStore(int(os.environ.get('SESSION_LRU_SIZE', 10000))))
+elif SESSION_BACKEND != 'cookie':
+    raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND}")
 
-@app.route('/', methods=['GET', 'POST'])
-def index():
+# Per-stage timings and verdict counters, served in Prometheus format from /metrics
+# and merged across gunicorn workers through snapshots in METRICS_DIR.
+metrics = Metrics(enabled=os.environ.get('METRICS_ENABLED', '1') == '1', directory=os.environ.get('METRICS_DIR'))
+if metrics.enabled:
+    app.session_interface = InstrumentedSessionInterface(app.session_interface, metrics)
+    app.after_request(lambda response: (metrics.flush(), response)[1])
+
+# Every prompt, its verdict and any hint event is queued here and written to the
+# 'attempts' table in batches by a background thread.
+attempt_log = AttemptLog(
+    app,
+    max_queue=int(os.environ.get('ATTEMPT_LOG_QUEUE_SIZE', 10000)),
+    batch_size=int(os.environ.get('ATTEMPT_LOG_BATCH_SIZE', 500)),
+    flush_interval=float(os.environ.get('ATTEMPT_LOG_FLUSH_INTERVAL', 1.0)),
+    policy=os.environ.get('ATTEMPT_LOG_POLICY', 'drop_newest'),
+)
+
+# Keyword verdicts per (level, case-folded and whitespace-collapsed prompt), so
+# resubmitted prompts skip the keyword scan. VERDICT_CACHE_SHARED_PATH adds a SQLite
+# file shared by all workers, capped at VERDICT_CACHE_SHARED_SIZE rows;
+# VERDICT_CACHE_SIZE=0 turns the cache off.
+VERDICT_CACHE_SIZE = int(os.environ.get('VERDICT_CACHE_SIZE', 10000))
+verdict_cache = VerdictCache(
+    maxsize=VERDICT_CACHE_SIZE,
+    ttl=float(os.environ.get('VERDICT_CACHE_TTL', 600)),
+    shared_path=os.environ.get('VERDICT_CACHE_SHARED_PATH'),
+    shared_maxsize=int(os.environ.get('VERDICT_CACHE_SHARED_SIZE', 100000)),
+)
+
+def level_rate_limit(level):
+    # A level's own session limit; a pack that does not load leaves the default
+    try:
+        return LEVELS[level].get('rate_limit') if level in LEVELS else None
+    except LevelPackError:
+        return None
+
+
+# Token buckets per session cookie and per client address in a SQLite file shared by
+# all workers, checked before Flask decodes the session. Levels may set their own
+# session limit with a "rate_limit" entry in their level pack. The session bucket is
+# the main control: the address bucket is shared by every player behind one NAT, so
+# it only stops floods (RATE_LIMIT_ADDRESS=off drops it).
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+rate_limiter = RateLimiter(
+    os.environ.get('RATE_LIMIT_DB', os.path.join(app.instance_path, 'ratelimit.db')),
+    session_limit=os.environ.get('RATE_LIMIT_SESSION', '1/10'),
+    address_limit=os.environ.get('RATE_LIMIT_ADDRESS', '50/500'),
+    level_limit=level_rate_limit,
+    max_idle=app.permanent_session_lifetime.total_seconds(),
+)
+if RATE_LIMIT_ENABLED:
+    os.makedirs(app.instance_path, exist_ok=True)
+    app.wsgi_app = RateLimitMiddleware(
+        app.wsgi_app, rate_limiter, app.config['SESSION_COOKIE_NAME'],
+        paths=('/', '/api/chat', '/api/chat/stream'),
+        trusted_proxies=int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0)),
+        on_reject=lambda scope: metrics.inc('ctf_rate_limited_total', scope=scope),
+    )
+
+# Who answers prompts that no filter or level rule handled: 'canned' replies, or
+# 'http', a batched model server at MODEL_URL (see model_server.py) that falls back
+# to canned replies on timeouts and errors.
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'canned')
+if MODEL_BACKEND == 'canned':
+    responder = CannedResponder()
+elif MODEL_BACKEND == 'http':
+    responder = BatchingResponder(
+        HTTPModelBackend(os.environ.get('MODEL_URL', 'http://127.0.0.1:8090/v1/batch')),
+        max_batch=int(os.environ.get('MODEL_MAX_BATCH', 16)),
+        max_wait=float(os.environ.get('MODEL_MAX_WAIT_MS', 10)) / 1000,
+        timeout=float(os.environ.get('MODEL_TIMEOUT', 2.0)),
+        max_in_flight=int(os.environ.get('MODEL_MAX_IN_FLIGHT', 4)),
+        on_result=lambda result: metrics.inc('ctf_model_replies_total', result=result),
+    )
+else:
+    raise ValueError(f"Unknown MODEL_BACKEND: {MODEL_BACKEND}")
+
+# Organizer statistics (solves, attempts to solve, hint use per level), kept as
+# running totals in the database and served from /analytics
+analytics = Analytics(
+    app,
+    flush_interval=float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 5.0)),
+    cache_ttl=float(os.environ.get('ANALYTICS_CACHE_TTL', 5.0)),
+)
+
+# Streamed replies (/api/chat/stream). A stream holds one worker thread until it
+# ends, so each worker keeps at most STREAM_SLOTS open (fewer than the gunicorn
+# `threads`) and turns the rest away with a 503, which ctf.js answers by using
+# /api/chat. Heartbeats go out every STREAM_HEARTBEAT seconds while a reply is
+# pending, so proxies keep the connection and closed ones are noticed.
+STREAM_SLOTS = int(os.environ.get('STREAM_SLOTS', 2))
+STREAM_HEARTBEAT = float(os.environ.get('STREAM_HEARTBEAT', 1.0))
+STREAM_TIMEOUT = float(os.environ.get('STREAM_TIMEOUT', 30.0))
+# Cookie sessions go out with the response headers, before a streamed reply
+# exists, so with them the reply is ready before the stream starts
+STREAM_REPLIES = SESSION_BACKEND != 'cookie'
+stream_slots = threading.BoundedSemaphore(STREAM_SLOTS)
+stream_replies = ThreadPoolExecutor(max_workers=STREAM_SLOTS, thread_name_prefix='stream-reply')
+
+with app.app_context():
+    db.create_all()
+    if db.engine.dialect.name == 'sqlite':
+        # WAL lets the gunicorn workers read sessions while another one writes
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+
+# Static files and templates are loaded and compiled once at startup
+assets = StaticAssets(app)
+INDEX_TEMPLATE = app.jinja_env.get_template('index.html')
+COMPLETED_PAGE = Asset(app.jinja_env.get_template('completed.html').render().encode(), 'text/html')
+SHELL_PAGE = None # index.html without session data, rendered on first use (asset_url needs a request)
+
+
+@app.route('/completed')
+def completed():
+    return COMPLETED_PAGE.response(app, max_age=3600)
+
+
+MAX_HISTORY_LENGTH = 20
+
+
+def start_session():
     username = session.get('username', 'CTF Player')
 
     if 'level' not in session:
@@ -115,13 +167,35 @@ def index():
         session['history'] = []
         session['attempts'] = 0
         session['hints_data'] = {}
-        session['history'].append(("assistant", f"👋 Hello {username}! Welcome to the TrustHub AI CTF. Your mission is to extract hidden flags from me across {len(LEVELS)} levels. Good luck!"))
+        session['history'].append([messages.WELCOME, username, len(LEVELS)])
+        session['seq'] = 1
         session.modified = True
 
-    level = session.get('level', 1)
+    record_rate_limit_level()
+    return username
+
+
+def record_rate_limit_level():
+    # Puts the player's level on their rate limit bucket, which is keyed by session
+    # id: a session that levelled up before it had an id (its first request) gets
+    # it recorded on the next request. `rate_limit_level` remembers what was sent.
+    if not RATE_LIMIT_ENABLED or not getattr(session, 'sid', None):
+        return
+    if session.get('rate_limit_level') != session['level']:
+        rate_limiter.set_level(session.sid, session['level'])
+        session['rate_limit_level'] = session['level']
+
+
+def handle_prompt(level, prompt, defer_reply=False):
+    # Runs one Prompt through the filters and the level rules, updating the session.
+    # Returns the new history entries, whether a level was completed, the hint to show
+    # and whether the model reply is still owed: with `defer_reply`, a prompt that
+    # falls through to the model gets no reply here and the caller adds it later
+    # with add_reply().
     history = session.get('history', [])
     attempts = session.get('attempts', 0)
-    
+    history_length = len(history)
+
     hints_data = session.get('hints_data', {}) 
     level_data = hints_data.setdefault(str(level), {
         'current_hint_index': 0,
@@ -132,339 +206,468 @@ def index():
 
     current_hint_index = level_data['current_hint_index']
     awaiting_hint_response = level_data['awaiting_hint_response']
-    used_hint_for_score = level_data['hint_taken_for_score']
     attempts_at_last_offer = level_data['attempts_at_last_offer']
 
     celebrate_level = False 
     display_hint_text = None
 
-    if level not in LEVELS:
-        return render_template_string("""
-            <html><head><title>TrustHub Chat CTF</title>
-            <meta name='viewport' content='width=device-width, initial-scale=1.0'>
-            <style>
-            body { 
-                font-family: 'Segoe UI', sans-serif; 
-                max-width: 600px; 
-                margin: auto; 
-                padding: 1em; 
-                background: #1a1a1a;
-                color: #f8f8f2;
-                text-align: center; 
-            }
-            h2 { color: #61dafb; }
-            p { color: #f8f8f2; }
-            </style></head><body>
-            <h2>🎉 Congratulations, CTF Player! You've completed all levels!</h2>
-            <p>Go back to the CTF platform to submit your flags and check the scoreboard!</p>
-            </body></html>
-        """)
-
-    challenge = LEVELS[level]
-
     response = None
-    if request.method == 'POST':
-        user_input = request.form.get('user_input', '').strip()
-        history.append(("user", str(escape(user_input))))
+    pending_reply = False
+    history.append(str(escape(prompt.raw)))
 
-        try:
-            if any(word in user_input.lower() for word in GENERAL_EXFIL_KEYWORDS) and "password" in user_input.lower():
-                response = "🤖 I am unable to do that."
-                history.append(("assistant", str(response)))
-            elif any(pattern.search(user_input) for pattern in SUSPICIOUS_PATTERNS):
-                response = "🤖 I cannot process or output arbitrary code or long, generic strings. Please focus on the challenge."
-                history.append(("assistant", str(response)))
-                attempts += 1
-                session['attempts'] = attempts
-            
-            elif awaiting_hint_response:
-                level_data['awaiting_hint_response'] = False
-
-                if user_input.lower() in ['yes', 'y']:
-                    if current_hint_index < len(challenge['hints']):
-                        display_hint_text = challenge['hints'][current_hint_index]
-                        response = f"🤖 Hint: {display_hint_text}"
-                        level_data['current_hint_index'] = current_hint_index + 1
-                        level_data['hint_taken_for_score'] = True
-                    else:
-                        response = "🤖 No more hints available for this level."
-                elif user_input.lower() in ['no', 'n']:
-                    response = "🤖 Okay, keep trying! Remember, I can offer another hint after a few more attempts if you get stuck."
-                else:
-                    response = "🤖 Please answer 'yes' or 'no' regarding the hint."
-                
-                history.append(("assistant", str(response)))
-
-            elif challenge['check'](user_input):
-                completed_level = level
-                response = f"🎉 Congrats! Password: {challenge['password']}"
-                history.append(("assistant", str(response)))
-                celebrate_level = True
-
-                session['level'] += 1
-                session['attempts'] = 0
-                hints_data.pop(str(completed_level), None) 
-                hints_data.setdefault(str(session['level']), {
-                    'current_hint_index': 0,
-                    'awaiting_hint_response': False,
-                    'hint_taken_for_score': False,
-                    'attempts_at_last_offer': -5
-                })
-
-                level_up_message = ""
-                if session['level'] <= len(LEVELS):
-                    level_up_message = f"🌟 You've moved up to Level {session['level']}!"
+    branch = 'error'
+    suspicious_rule = None
+    hint_event = None
+    try:
+        # Inside the try: a level pack that fails to load raises LevelPackError here
+        challenge = LEVELS[level]
+        lowered = prompt.lowered
+        with metrics.stage('keyword_filter'):
+            blocked_exfil, solved, mentions_password, mentions_hint = cached_keyword_flags(challenge, level, lowered)
+
+        if blocked_exfil:
+            branch = BLOCKED_EXFIL
+            response = messages.BLOCKED_EXFIL
+            history.append(response)
+        elif (suspicious_rule := timed_pattern_scan(prompt.text)):
+            branch = BLOCKED_PATTERN
+            app.logger.info("Blocked prompt at level %s by suspicious pattern %r", level, suspicious_rule)
+            response = messages.BLOCKED_PATTERN
+            history.append(response)
+            attempts += 1
+            session['attempts'] = attempts
+        
+        elif awaiting_hint_response:
+            branch = 'hint_answer'
+            level_data['awaiting_hint_response'] = False
+
+            if lowered in ['yes', 'y']:
+                if current_hint_index < len(challenge['hints']):
+                    display_hint_text = challenge['hints'][current_hint_index]
+                    response = [messages.HINT, level, current_hint_index, display_hint_text]
+                    level_data['current_hint_index'] = current_hint_index + 1
+                    level_data['hint_taken_for_score'] = True
+                    hint_event = 'given'
                 else:
-                    level_up_message = "🏆 All levels completed! Great job!"
-                history.append(("assistant", str(level_up_message)))
+                    response = messages.NO_MORE_HINTS
+            elif lowered in ['no', 'n']:
+                response = messages.HINT_DECLINED
+                hint_event = 'declined'
+            else:
+                response = messages.HINT_ANSWER_YES_NO
+            
+            history.append(response)
+
+        elif solved:
+            branch = SOLVED
+            metrics.inc('ctf_level_completions_total', level=level)
+            analytics.record_solve(level, attempts + 1, level_data['hint_taken_for_score'])
+            completed_level = level
+            response = [messages.CONGRATS, level, challenge['password']]
+            history.append(response)
+            celebrate_level = True
 
+            session['level'] += 1
+            session['attempts'] = 0
+            record_rate_limit_level()
+            hints_data.pop(str(completed_level), None) 
+            hints_data.setdefault(str(session['level']), {
+                'current_hint_index': 0,
+                'awaiting_hint_response': False,
+                'hint_taken_for_score': False,
+                'attempts_at_last_offer': -5
+            })
+
+            if session['level'] <= len(LEVELS):
+                level_up_message = [messages.LEVEL_UP, session['level']]
             else:
-                attempts += 1
-                session['attempts'] = attempts
-
-                if (attempts >= 5 and
-                    not awaiting_hint_response and
-                    current_hint_index < len(challenge['hints']) and
-                    attempts >= (attempts_at_last_offer + 5)):
-                    
-                    response = "🤖 You've made a few attempts. Would you like a hint for this level? (Type 'yes' or 'no')"
-                    level_data['awaiting_hint_response'] = True
+                level_up_message = messages.ALL_LEVELS_COMPLETED
+            history.append(level_up_message)
+
+        else:
+            branch = NOT_SOLVED
+            attempts += 1
+            session['attempts'] = attempts
+
+            if (attempts >= 5 and
+                not awaiting_hint_response and
+                current_hint_index < len(challenge['hints']) and
+                attempts >= (attempts_at_last_offer + 5)):
+                
+                response = messages.HINT_OFFER
+                metrics.inc('ctf_hint_offers_total', level=level)
+                hint_event = 'offered'
+                level_data['awaiting_hint_response'] = True
+                level_data['attempts_at_last_offer'] = attempts
+            elif attempts >= 5 and current_hint_index >= len(challenge['hints']):
+                response = messages.ALL_HINTS_GIVEN
+            elif lowered in ["hi", "hello", "hey", "hallo", "good morning", "good afternoon", "good evening"]:
+                response = random.choice(messages.GREETINGS)
+            elif mentions_password:
+                response = messages.NO_DIRECT_PASSWORD
+            elif mentions_hint:
+                if current_hint_index < len(challenge['hints']):
+                    display_hint_text = challenge['hints'][current_hint_index]
+                    response = messages.HINT_GIVEN
+                    level_data['current_hint_index'] = current_hint_index + 1
+                    level_data['hint_taken_for_score'] = True
+                    level_data['awaiting_hint_response'] = False
                     level_data['attempts_at_last_offer'] = attempts
-                elif attempts >= 5 and current_hint_index >= len(challenge['hints']):
-                    response = "🤖 I've given all the hints I can for this level. Keep trying!"
-                elif user_input.lower() in ["hi", "hello", "hey", "hallo", "good morning", "good afternoon", "good evening"]:
-                    response = random.choice([
-                        "👋 Hi there! How can I help you with this challenge?",
-                        "🤖 Hello! Ready to crack this level?",
-                        "Greetings! What's on your mind?",
-                        "Hey! Still working on the CTF? Let me know if you need anything (besides the password!)."
-                    ])
-                elif "password" in user_input.lower():
-                    response = "🤖 I cannot directly provide the password. You need to figure out how to extract it!"
-                elif "hint" in user_input.lower():
-                    if current_hint_index < len(challenge['hints']):
-                        display_hint_text = challenge['hints'][current_hint_index]
-                        response = f"🤖 Here's your hint! Good luck!"
-                        level_data['current_hint_index'] = current_hint_index + 1
-                        level_data['hint_taken_for_score'] = True
-                        level_data['awaiting_hint_response'] = False
-                        level_data['attempts_at_last_offer'] = attempts
-                    else:
-                        response = "🤖 I've already given all hints for this level."
+                    hint_event = 'given'
                 else:
-                    response = random.choice([
-                        "🤖 Hmm, I'm not sure what you mean. Try phrasing your prompt differently!",
-                        "I can't quite process that. Remember, this is a CTF!",
-                        "That input doesn't seem to help with the challenge. Keep thinking!",
-                        "My circuits are buzzing, but I'm not getting it. Try another approach."
-                    ])
-
-                history.append(("assistant", str(response)))
-
-        except Exception as e:
-            response = f"🤖 An unexpected error occurred: {escape(str(e))}. Please try again."
-            history.append(("assistant", str(response)))
-            print(f"Error during interaction: {e}")
-
-        session['history'] = history
-        session['hints_data'] = hints_data 
-        
-        MAX_HISTORY_LENGTH = 20
+                    response = messages.HINTS_EXHAUSTED
+            elif defer_reply:
+                pending_reply = True
+            else:
+                with metrics.stage('model_reply'):
+                    response = responder.reply(level, prompt.raw)
+
+            if not pending_reply:
+                history.append(response)
+
+    except Exception as e:
+        response = [messages.ERROR, str(escape(str(e)))]
+        history.append(response)
+        print(f"Error during interaction: {e}")
+
+    metrics.inc('ctf_verdicts_total', level=level, branch=branch)
+    if history_length == 1:
+        # A player's first prompt (only the welcome message before it): sessions
+        # that never send one, such as crawlers and health checks, are not players
+        analytics.record_start()
+    analytics.record_attempt(level)
+    if hint_event:
+        analytics.record_hint(level, hint_event)
+    attempt_log.record(session_id=getattr(session, 'sid', None), level=level, prompt=prompt.raw,
+                       verdict=branch, rule=suspicious_rule, hint_event=hint_event)
+
+    session['history'] = history
+    session['hints_data'] = hints_data 
+    # Sequence number of the newest message, so clients can fetch only what they miss
+    session['seq'] = session.get('seq', history_length) + len(history) - history_length
+    new_entries = history[history_length:]
+
+    with metrics.stage('history_trim'):
         if len(session['history']) > MAX_HISTORY_LENGTH:
             session['history'] = session['history'][-MAX_HISTORY_LENGTH:]
-        
-        session.modified = True
 
-    chat_html = "".join(f"<p class='chat-message {'user-message' if s == 'user' else 'bot-message'}'><b>{'You' if s == 'user' else 'Bot'}:</b> {m}</p>" for s, m in history)
+    session.modified = True
+    return new_entries, celebrate_level, display_hint_text, pending_reply
+
+
+def add_reply(session, entry):
+    # Appends a deferred model reply to `session` (the object, as streams finish
+    # after the request context is gone) and returns its sequence number
+    history = session.get('history', [])
+    history.append(entry)
+    session['history'] = history[-MAX_HISTORY_LENGTH:]
+    session['seq'] = session.get('seq', len(history) - 1) + 1
+    session.modified = True
+    return session['seq']
+
+
+def timed_pattern_scan(text):
+    with metrics.stage('pattern_filter'):
+        return SUSPICIOUS_SCANNER.search(text)
+
+
+def cached_keyword_flags(challenge, level, lowered):
+    # The level's keyword flags through the verdict cache. Only keyword verdicts are
+    # cached: SUSPICIOUS_PATTERNS are case-sensitive and still run on every prompt.
+    # The rules themselves are timed as 'level_check', so that stage now only sees
+    # cache misses, inside 'keyword_filter' which also covers the lookup.
+    if not VERDICT_CACHE_SIZE:
+        return timed_level_check(challenge, lowered)
+    flags, result = verdict_cache.get_or_compute(challenge['version'], level, lowered, lambda: timed_level_check(challenge, lowered))
+    metrics.inc('ctf_verdict_cache_total', result=result)
+    return flags
+
+
+def timed_level_check(challenge, lowered):
+    with metrics.stage('level_check'):
+        return challenge['flags'](lowered)
+
+
+def render_message(entry):
+    sender, text = messages.expand(entry, LEVELS)
+    return {'sender': sender, 'html': text}
+
+
+@app.route('/', methods=['GET', 'POST'])
+def index():
+    username = start_session()
+    level = session.get('level', 1)
+
+    if level not in LEVELS:
+        return redirect(url_for('completed'))
+
+    celebrate_level = False 
+    display_hint_text = None
+    history = session.get('history', [])
+    if request.method == 'POST':
+        try:
+            prompt = Prompt(request.form.get('user_input', ''), MAX_PROMPT_LENGTH)
+        except PromptTooLong as e:
+            return str(e), 413
+        # Appends to `history` in place; the page shows it before the session copy is trimmed
+        _, celebrate_level, display_hint_text, _ = handle_prompt(level, prompt)
+
+    with metrics.stage('render'):
+        return render_page(level, history, celebrate_level, display_hint_text, username)
+
+
+def render_page(level, history, celebrate_level, display_hint_text, username):
+    chat_html = "".join(f"<p class='chat-message {'user-message' if s == 'user' else 'bot-message'}'><b>{'You' if s == 'user' else 'Bot'}:</b> {m}</p>" for s, m in (messages.expand(entry, LEVELS) for entry in history))
     
     hint_html = ""
     if display_hint_text:
         hint_html = f"<div class='hint-box'>💡 Hint: {display_hint_text}</div>"
     
-    html_content = """
-        <html>
-        <head>
-            <title>TrustHub Chat CTF</title>
-            <meta name='viewport' content='width=device-width, initial-scale=1.0'>
-            <style>
-            body {
-                font-family: 'Segoe UI', sans-serif;
-                max-width: 600px;
-                margin: auto;
-                padding: 1em;
-                background: #1a1a1a;
-                color: #f8f8f2;
-                line-height: 1.6;
-                display: flex;
-                flex-direction: column;
-                min-height: 100vh;
-            }
-            h2 {
-                color: #61dafb;
-                text-align: center;
-                margin-bottom: 1.5em;
-                text-shadow: 0 0 8px rgba(97, 218, 251, 0.5);
-            }
-            .chat-container {
-                background-color: #282c34;
-                border-radius: 12px;
-                padding: 1.2em;
-                margin-bottom: 1.5em;
-                box-shadow: 0 6px 15px rgba(0,0,0,0.5);
-                max-height: 400px;
-                overflow-y: auto;
-                border: 1px solid #4a627a;
-                flex-grow: 1;
-            }
-            .chat-message {
-                margin: 0.8em 0;
-                padding: 0.6em 1em;
-                border-radius: 8px;
-                max-width: 85%;
-                word-wrap: break-word;
-            }
-            .user-message {
-                background-color: #3a3f4b;
-                align-self: flex-end;
-                margin-left: auto;
-                border-bottom-right-radius: 2px;
-            }
-            .bot-message {
-                background-color: #44475a;
-                align-self: flex-start;
-                margin-right: auto;
-                border-bottom-left-radius: 2px;
-            }
-            .chat-container b {
-                color: #a9dc76;
-            }
-            .bot-message b {
-                color: #ff6188;
-            }
-            textarea {
-                width: calc(100% - 1em);
-                height: 6em;
-                font-size: 1em;
-                padding: 0.8em;
-                border-radius: 8px;
-                border: 1px solid #5d6d7e;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.3);
-                resize: vertical;
-                margin-bottom: 1em;
-                background-color: #3a3f4b;
-                color: #f8f8f2;
-                transition: border-color 0.3s ease, box-shadow 0.3s ease;
-            }
-            textarea:focus {
-                border-color: #61dafb;
-                box-shadow: 0 0 10px rgba(97, 218, 251, 0.7);
-                outline: none;
-            }
-            input[type=submit] {
-                padding: 0.8em 1.5em;
-                font-size: 1.1em;
-                background-color: #61dafb;
-                color: #1a1a1a;
-                border: none;
-                border-radius: 8px;
-                cursor: pointer;
-                transition: background-color 0.3s ease, transform 0.2s ease, box-shadow 0.3s ease;
-                display: block;
-                width: 100%;
-                box-sizing: border-box;
-                font-weight: bold;
-                text-shadow: 0 0 5px rgba(0,0,0,0.3);
-            }
-            input[type=submit]:hover {
-                background-color: #4fa3d1;
-                transform: translateY(-2px);
-                box-shadow: 0 8px 20px rgba(97, 218, 251, 0.4);
-            }
-            input[type=submit]:active {
-                transform: translateY(0);
-                box-shadow: 0 4px 10px rgba(97, 218, 251, 0.3);
-            }
-            .hint-box {
-                background:#44475a;
-                padding:1em;
-                border-radius:8px;
-                margin-top:1.5em;
-                border: 1px solid #7f8c8d;
-                color: #f8f8f2;
-                font-style: italic;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.3);
-            }
-            .footer-links {
-                text-align: center;
-                margin-top: 2.5em;
-                padding-top: 1em;
-                border-top: 1px solid #4a627a;
-            }
-            .footer-links a {
-                color: #bd93f9;
-                text-decoration: none;
-                margin: 0 15px;
-                font-weight: bold;
-                transition: color 0.3s ease;
-            }
-            .footer-links a:hover {
-                color: #ff79c6;
-                text-decoration: underline;
-            }
-            </style>
-            <!-- Confetti.js CDN for celebration effect -->
-            <script src="https://cdn.jsdelivr.net/npm/canvas-confetti@1.9.2/dist/confetti.browser.min.js"></script>
-        </head>
-        <body>
-            <h2>🤖 TrustHub AI CTF — Level {{ level }}</h2>
-            <div class="chat-container">
-                {{ chat_html | safe }}
-            </div>
-            <form method='POST'>
-                <textarea name='user_input' required placeholder='Type your prompt...'></textarea>
-                <input type='submit' value='Send'>
-            </form>
-            {{ hint_html | safe }}
-            <div class="footer-links">
-                <!-- Removed scoreboard and logout links as they are handled by CTFd -->
-                <!-- <a href='/scoreboard'>Scoreboard</a> -->
-                <!-- <a href='/logout'>Logout</a> -->
-            </div>
-
-            <script>
-                // This script runs after the DOM is loaded
-                if ({{ celebrate_level | tojson }}) {
-                    confetti({
-                        particleCount: 100,
-                        spread: 70,
-                        origin: { y: 0.6 }
-                    });
-                    // You can add more bursts for a grander effect
-                    setTimeout(() => {
-                        confetti({
-                            particleCount: 80,
-                            spread: 80,
-                            origin: { y: 0.5, x: 0.2 }
-                        });
-                    }, 200);
-                    setTimeout(() => {
-                        confetti({
-                            particleCount: 80,
-                            spread: 80,
-                            origin: { y: 0.5, x: 0.8 }
-                        });
-                    }, 400);
-                }
-            </script>
-        </body>
-        </html>
-    """
-    return render_template_string(html_content, level=level, chat_html=chat_html, hint_html=hint_html, celebrate_level=celebrate_level, username=username)
+    return render_template(INDEX_TEMPLATE, level=level, chat_html=chat_html, hint_html=hint_html, celebrate_level=celebrate_level, username=username, seq=session.get('seq', len(history)), max_prompt_length=MAX_PROMPT_LENGTH)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/analytics')
+def analytics_endpoint():
+    response = app.json.response(analytics.summary(list(LEVELS)))
+    response.cache_control.public = True
+    response.cache_control.max_age = int(analytics.cache_ttl)
+    return response
+
+
+@app.route('/chat')
+def chat_shell():
+    # The chat page without any session data, so browsers and proxies can cache it;
+    # ctf.js fills in the level and history from /api/chat
+    global SHELL_PAGE
+    if SHELL_PAGE is None:
+        SHELL_PAGE = Asset(render_template(INDEX_TEMPLATE, shell=True, level='', chat_html='', hint_html='', celebrate_level=False, seq=0, max_prompt_length=MAX_PROMPT_LENGTH).encode(), 'text/html')
+    return SHELL_PAGE.response(app, max_age=300)
+
+
+@app.route('/api/chat', methods=['GET', 'POST'])
+def api_chat():
+    # JSON counterpart of index(): POST {"prompt": ..., "since": seq} runs one prompt
+    # and returns only the messages after `since` (by default, the ones it added).
+    # GET ?since=seq returns missed messages without sending a prompt. When `since`
+    # falls outside the stored window the whole window comes back with "reset": true.
+    payload, error = read_payload()
+    if error:
+        return error
+    since, error = read_since(payload)
+    if error:
+        return error
+    start_session()
+    level = session.get('level', 1)
+
+    celebrate_level = False
+    display_hint_text = None
+    new_entries = []
+    if request.method == 'POST' and level in LEVELS:
+        prompt, error = read_prompt(payload)
+        if error:
+            return error
+        new_entries, celebrate_level, display_hint_text, _ = handle_prompt(level, prompt)
+
+    return chat_update(since, new_entries, celebrate_level, display_hint_text)
+
+
+def read_payload():
+    # The POSTed JSON object (a body that is not JSON counts as empty) or the query
+    # string of a GET, or the error response for JSON that is not an object
+    if request.method != 'POST':
+        return request.args, None
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return {}, None
+    if not isinstance(payload, dict):
+        return None, ({'error': "The request body must be a JSON object"}, 400)
+    return payload, None
+
+
+def read_prompt(payload):
+    # The Prompt in a JSON payload, or the error response for a missing or bad one
+    text = payload.get('prompt')
+    if not isinstance(text, str):
+        return None, ({'error': "'prompt' must be a non-empty string"}, 400)
+    try:
+        prompt = Prompt(text, MAX_PROMPT_LENGTH)
+    except PromptTooLong as e:
+        return None, ({'error': str(e)}, 413)
+    if not prompt:
+        return None, ({'error': "'prompt' must be a non-empty string"}, 400)
+    return prompt, None
+
+
+def read_since(payload):
+    # The `since` in a payload (None if there is none), or the error response for a
+    # bad one. Checked before the prompt runs, so a rejected request changes nothing.
+    try:
+        return (int(payload['since']) if payload.get('since') is not None else None), None
+    except (TypeError, ValueError):
+        return None, ({'error': "'since' must be an integer"}, 400)
+
+
+def chat_update(since, new_entries, celebrate_level, display_hint_text):
+    # The /api/chat response: session state and the messages after `since`, by
+    # default the new entries
+    history = session.get('history', [])
+    seq = session.get('seq', len(history))
+    first_seq = seq - len(history) + 1
+    if since is None:
+        since = seq - len(new_entries)
+
+    reset = since < first_seq - 1
+    start = max(since + 1, first_seq)
+    return {
+        'seq': seq,
+        'level': session.get('level', 1),
+        'completed': session.get('level', 1) not in LEVELS,
+        'celebrate': celebrate_level,
+        'hint': display_hint_text,
+        'reset': reset,
+        'messages': [dict(render_message(entry), seq=n) for n, entry in enumerate(history[start - first_seq:], start)],
+    }
+
+
+# A tag, a word with the whitespace after it, or whitespace: the pieces a streamed
+# reply is sent in, so no piece ends inside a tag
+REPLY_PIECES = re.compile(r'<[^>]*>|[^<\s]+\s*|\s+')
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def api_chat_stream():
+    # Server-sent-events counterpart of POST /api/chat, with the same request body.
+    # A "chat" event carries the /api/chat response as soon as the verdict is known.
+    # A reply still owed by the model follows as a "reply" event and "delta" events
+    # with pieces of its HTML, and the stream ends with "done" and the final seq.
+    if not stream_slots.acquire(blocking=False):
+        metrics.inc('ctf_streams_total', result='rejected')
+        return {'error': "Too many open streams, use /api/chat"}, 503, {'Retry-After': '1'}
+
+    response = None
+    try:
+        payload, error = read_payload()
+        if error:
+            return error
+        since, error = read_since(payload)
+        if error:
+            return error
+        start_session()
+        level = session.get('level', 1)
+
+        prompt = None
+        celebrate_level = False
+        display_hint_text = None
+        new_entries = []
+        pending_reply = False
+        if level in LEVELS:
+            prompt, error = read_prompt(payload)
+            if error:
+                return error
+            new_entries, celebrate_level, display_hint_text, pending_reply = handle_prompt(level, prompt, defer_reply=STREAM_REPLIES)
+
+        update = chat_update(since, new_entries, celebrate_level, display_hint_text)
+        events, close = stream_reply(session._get_current_object(), update, level, prompt, pending_reply)
+        response = Response(stream_with_context(events), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        response.call_on_close(close)
+        return response
+    finally:
+        if response is None:
+            stream_slots.release()
+
+
+def stream_reply(saved, update, level, prompt, pending_reply):
+    # The events of one stream, and the callback for when the server closes it.
+    # `saved` is the request's session object: a session started by this request
+    # only gets its id when it is saved, after this returns and before either runs.
+    # The slot is released there rather than in the generator, whose `finally`
+    # never runs if the client leaves before the first event. A reply the client
+    # left without is stored as a canned one, so every prompt keeps an answer.
+    state = {'pending': pending_reply, 'level': update['level']}
+
+    def store(entry):
+        # Appends the reply to the session as stored now, not as this request left
+        # it: other requests (a second tab, a level-up) may have saved it since.
+        # The response that carried the session cookie has already been sent.
+        state['pending'] = False
+        sid = getattr(saved, 'sid', None)
+        if sid is None:
+            return None
+        interface = app.session_interface
+        with app.app_context():
+            payload = interface.store.load(sid)
+            if payload is None:
+                return None # expired or emptied meanwhile
+            fresh = ServerSession(interface.serializer.loads(payload), sid=sid, payload=payload)
+            seq = add_reply(fresh, entry)
+            interface.save_session(app, fresh, app.response_class())
+        state['level'] = fresh.get('level', 1)
+        return seq
+
+    def close():
+        try:
+            if state['pending']:
+                metrics.inc('ctf_streams_total', result='abandoned')
+                store(random.choice(messages.FALLBACKS))
+        finally:
+            stream_slots.release()
+            metrics.flush() # after_request ran before the stream did
+
+    def generate():
+        yield sse('chat', update)
+        seq = update['seq']
+        if state['pending']:
+            future = stream_replies.submit(timed_reply, level, prompt.raw)
+            deadline = time.monotonic() + STREAM_TIMEOUT
+            while True:
+                try:
+                    entry = future.result(timeout=STREAM_HEARTBEAT)
+                    break
+                except FutureTimeout:
+                    if time.monotonic() >= deadline:
+                        entry = random.choice(messages.FALLBACKS)
+                        break
+                    yield ": heartbeat\n\n"
+            seq = store(entry) or seq
+            message = render_message(entry)
+            yield sse('reply', {'sender': message['sender'], 'seq': seq})
+            for piece in REPLY_PIECES.findall(message['html']):
+                yield sse('delta', {'html': piece})
+        metrics.inc('ctf_streams_total', result='completed')
+        yield sse('done', {'seq': seq, 'level': state['level'], 'completed': state['level'] not in LEVELS})
+
+    return generate(), close
+
+
+def timed_reply(level, text):
+    with metrics.stage('model_reply'):
+        return responder.reply(level, text)
+
+
+def warm_up():
+    # Does the one-time work a first request would otherwise do: compiles every
+    # level pack and builds the URL matcher. gunicorn.conf.py calls this in the
+    # master, before the workers fork, so they share the result. It deliberately
+    # serves no request, which would leave metrics and sessions in the master.
+    for level in LEVELS:
+        LEVELS[level]
+    app.url_map.bind('localhost').match('/')
+    with app.app_context():
+        db.engine.dispose() # workers must not share the master's pooled connections
 
 
 if __name__ == '__main__':
+    # Development server; production runs `gunicorn -c gunicorn.conf.py app:app`
     from os import environ
-    import multiprocessing
-    workers = multiprocessing.cpu_count() * 2 + 1
     app.run(host='0.0.0.0', port=int(environ.get("PORT", 8083)))
 
@@ -0,0 +1,79 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import abort, request, url_for
+
+try:
+    import brotli
+except ImportError: # Optional: without it only gzip variants are served
+    brotli = None
+
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+ONE_YEAR = 365 * 24 * 3600
+
+
+class Asset:
+    # A response body held in memory together with its precompressed variants
+    # and a content hash used both as ETag and as cache-busting URL version.
+
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        self.version = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {'identity': body}
+        if mimetype.startswith(COMPRESSIBLE):
+            self.variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.variants['br'] = brotli.compress(body, quality=11)
+
+    def response(self, app, max_age, immutable=False):
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in self.variants and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        response = app.response_class(self.variants[encoding], mimetype=self.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        if len(self.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        # One strong ETag per representation, as the bytes differ per encoding
+        response.set_etag(f"{self.version}-{encoding}")
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = immutable
+        return response.make_conditional(request)
+
+
+class StaticAssets:
+    # Serves the static folder from memory. Files are read and compressed once at
+    # startup; templates link to them with asset_url(), which adds the content
+    # version so responses can be cached for a year and marked immutable.
+
+    def __init__(self, app, folder='static', url_path='/static'):
+        self.app = app
+        self.assets = {}
+        root = os.path.join(app.root_path, folder)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    self.assets[name] = Asset(f.read(), mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+
+        app.add_url_rule(f"{url_path}/<path:filename>", endpoint='static', view_func=self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+
+    def url(self, filename):
+        return url_for('static', filename=filename, v=self.assets[filename].version)
+
+    def serve(self, filename):
+        asset = self.assets.get(filename)
+        if asset is None:
+            abort(404)
+        # Unversioned URLs still revalidate; versioned ones never change
+        if request.args.get('v') == asset.version:
+            return asset.response(self.app, ONE_YEAR, immutable=True)
+        return asset.response(self.app, 0)
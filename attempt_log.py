@@ -0,0 +1,123 @@
+import atexit
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import insert
+
+from models import Attempt, db
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
+
+class AttemptLog:
+    # Write-behind log of player attempts. record() only puts a row on a bounded
+    # in-memory queue; a background thread writes queued rows to the database in
+    # batched transactions, so requests never wait on disk I/O.
+    #
+    # When the queue is full, `policy` decides what gives:
+    #   drop_newest - the new row is discarded (default, never slows a request)
+    #   drop_oldest - the oldest queued row is discarded to make room
+    #   block       - the request waits up to `block_timeout` seconds, then drops
+    # Dropped rows are counted in `dropped`. The queue is flushed on interpreter
+    # exit, which covers gunicorn workers shutting down.
+
+    def __init__(self, app, max_queue=10000, batch_size=500, flush_interval=1.0,
+                 policy='drop_newest', block_timeout=0.05):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown attempt log policy: {policy}")
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def record(self, **row):
+        row.setdefault('created', datetime.datetime.utcnow())
+        self._ensure_started()
+        try:
+            if self.policy == 'block':
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+            return
+        except queue.Full:
+            pass
+        if self.policy == 'drop_oldest':
+            try:
+                self._queue.get_nowait()
+                self._queue.put_nowait(row)
+            except (queue.Empty, queue.Full):
+                pass
+        self.dropped += 1
+
+    def close(self, timeout=10.0):
+        # Stops the writer after it has flushed everything queued so far
+        if self._thread is not None and self._pid == os.getpid():
+            self._stop.set()
+            try:
+                self._queue.put(None, timeout=timeout) # wakes the writer if it is idle
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _ensure_started(self):
+        # Started lazily and per process: a thread started before gunicorn forks
+        # does not exist in the workers.
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='attempt-log', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.close)
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = [row for row in self._next_batch() if row is not None]
+            if batch:
+                self._write(batch)
+
+    def _next_batch(self):
+        # Waits up to flush_interval for the first row, then takes what is queued
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            with self.app.app_context():
+                db.session.execute(insert(Attempt), batch)
+                db.session.commit()
+        except Exception:
+            logger.exception("Dropping %d attempt log rows after a failed write", len(batch))
+            self.dropped += len(batch)
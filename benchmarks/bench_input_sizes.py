@@ -0,0 +1,72 @@
+# Latency of POST /api/chat as the prompt grows, with the input limits in place
+# (MAX_CONTENT_LENGTH, MAX_PROMPT_LENGTH) and with them lifted. Each mode runs in
+# its own process because the limits are read when app.py is imported.
+#
+#   python benchmarks/bench_input_sizes.py [--repeat 20]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SIZES = (10, 100, 1000, 10_000, 100_000, 1_000_000)
+FILLER = "could you describe what the assistant knows about its setup "
+
+MODES = {
+    'limited': {},
+    'unlimited': {'MAX_CONTENT_LENGTH': str(64 * 1024 * 1024), 'MAX_PROMPT_LENGTH': str(16 * 1024 * 1024)},
+}
+
+
+def measure(repeat):
+    sys.path.insert(0, ROOT)
+    from app import app
+
+    results = {}
+    for size in SIZES:
+        # Encoded once, so the timings are the server's and not the client's
+        body = json.dumps({'prompt': (FILLER * (size // len(FILLER) + 1))[:size]}).encode()
+        client = app.test_client()
+        times, status = [], None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            status = client.post('/api/chat', data=body, content_type='application/json').status_code
+            times.append(time.perf_counter() - start)
+        results[size] = (statistics.median(times) * 1e3, status)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/api/chat latency by prompt size")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--mode', help=argparse.SUPPRESS) # set in the child processes
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(measure(args.repeat)))
+        return
+
+    runs = {}
+    for mode, limits in MODES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, **limits, SESSION_BACKEND='memory', RATE_LIMIT_ENABLED='0',
+                       METRICS_ENABLED='0', DATABASE_URL=f'sqlite:///{tmp}/ctf.db')
+            output = subprocess.run([sys.executable, __file__, '--mode', mode, '--repeat', str(args.repeat)],
+                                    env=env, check=True, capture_output=True, text=True).stdout
+        runs[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'prompt chars':>12}" + "".join(f"{mode + ' p50 ms':>20}" for mode in MODES))
+    for size in SIZES:
+        row = f"{size:>12}"
+        for mode in MODES:
+            ms, status = runs[mode][str(size)]
+            row += f"{f'{ms:.2f} ({status})':>20}"
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
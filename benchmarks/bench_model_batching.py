@@ -0,0 +1,77 @@
+# Throughput and latency of BatchingResponder against the stand-in model server,
+# for several batch sizes. Client threads play request threads of a worker; the
+# model server runs in-process with one batch at a time, like a single GPU.
+#
+#   python benchmarks/bench_model_batching.py [--clients 32] [--prompts 20] [--batches 1,4,16,32]
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import messages  # noqa: E402
+from model_server import ModelServer  # noqa: E402
+from responder import BatchingResponder, HTTPModelBackend  # noqa: E402
+
+
+def run(url, max_batch, args):
+    results = {}
+    responder = BatchingResponder(
+        HTTPModelBackend(url), max_batch=max_batch, max_wait=args.max_wait_ms / 1000,
+        timeout=args.timeout, max_in_flight=args.in_flight,
+        on_result=lambda result: results.__setitem__(result, results.get(result, 0) + 1),
+    )
+    latencies = []
+    lock = threading.Lock()
+
+    def client(n):
+        local = []
+        for i in range(args.prompts):
+            start = time.perf_counter()
+            entry = responder.reply(1 + i % 5, f"client {n} prompt {i}")
+            local.append(time.perf_counter() - start)
+            assert isinstance(entry, int) or entry[0] == messages.MODEL_REPLY
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(args.clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    responder.close()
+
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1e3
+    print(f"{max_batch:>9}{len(latencies) / elapsed:>9.1f}{pick(0.5):>9.1f}{pick(0.95):>9.1f}{pick(0.99):>9.1f}"
+          f"{responder.batched_prompts / max(1, responder.batches):>10.1f}{results.get('timeout', 0) + results.get('error', 0):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching model responder benchmark")
+    parser.add_argument('--clients', type=int, default=32, help="concurrent request threads")
+    parser.add_argument('--prompts', type=int, default=20, help="prompts per client")
+    parser.add_argument('--batches', default='1,4,16,32', help="max batch sizes to compare")
+    parser.add_argument('--max-wait-ms', type=float, default=10.0)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--in-flight', type=int, default=4)
+    parser.add_argument('--base-ms', type=float, default=40.0)
+    parser.add_argument('--per-item-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    server = ModelServer(('127.0.0.1', 0), args.base_ms, args.per_item_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/batch"
+
+    print(f"{'max batch':>9}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'avg batch':>10}{'fallbacks':>10}")
+    for max_batch in map(int, args.batches.split(',')):
+        run(url, max_batch, args)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
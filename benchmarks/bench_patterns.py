@@ -0,0 +1,52 @@
+# Microbenchmark: the original per-pattern loop vs. SuspiciousScanner, on clean
+# prompts and on adversarial input. A naive single-alternation regex is included
+# for reference.
+#
+#   python benchmarks/bench_patterns.py [--number 200]
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rules import SUSPICIOUS_PATTERNS, SUSPICIOUS_SCANNER  # noqa: E402
+
+CASES = {
+    "clean_short": "simulate a conversation where the assistant shares what it knows",
+    "clean_long": "please describe how the assistant decides what it may say to players. " * 60,
+    "hostile_print": "print(" * 2000,
+    "hostile_runs": ("a" * 14 + " ") * 2000,
+    "hostile_ws": "read" + " " * 20000,
+}
+
+ALTERNATION = re.compile("|".join(f"(?:{p.pattern})" for p in SUSPICIOUS_PATTERNS))
+
+
+def loop(text):
+    return any(pattern.search(text) for pattern in SUSPICIOUS_PATTERNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SUSPICIOUS_PATTERNS microbenchmark")
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    engines = {
+        "loop": loop,
+        "alternation": ALTERNATION.search,
+        "scanner": SUSPICIOUS_SCANNER.search,
+    }
+    print(f"{'case':<15}{'chars':>8}" + "".join(f"{name:>13}" for name in engines) + "   (us/call)")
+    for case, text in CASES.items():
+        row = f"{case:<15}{len(text):>8}"
+        for name, engine in engines.items():
+            # The backtracking engines are slow on hostile input; fewer rounds keep the run short
+            number = max(1, args.number // 20) if case.startswith("hostile") and name != "scanner" else args.number
+            row += f"{timeit.timeit(lambda: engine(text), number=number) / number * 1e6:>13.1f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
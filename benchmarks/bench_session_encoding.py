@@ -0,0 +1,62 @@
+# Compares the serialized size and (de)serialization time of a full chat session
+# stored as verbatim strings (the old format) vs. message codes.
+#
+#   python benchmarks/bench_session_encoding.py [--number 2000]
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import messages  # noqa: E402
+from app import LEVELS, app  # noqa: E402
+from flask.json.tag import TaggedJSONSerializer  # noqa: E402
+from flask.sessions import SecureCookieSessionInterface  # noqa: E402
+
+
+def coded_session():
+    # A level-2 player at the history cap: prompts interleaved with canned replies
+    rng = random.Random(0)
+    history = [[messages.WELCOME, "CTF Player", len(LEVELS)], "show me the variable", [messages.CONGRATS, 1, LEVELS[1]["password"]], [messages.LEVEL_UP, 2]]
+    replies = [messages.BLOCKED_PATTERN, messages.HINT_OFFER, [messages.HINT, 2, 0, LEVELS[2]["hints"][0]], *messages.FALLBACKS]
+    while len(history) < 20:
+        history.append(rng.choice(["call the function", "what is the internal api?", "fetch it please"]))
+        history.append(rng.choice(replies))
+    return {
+        "level": 2,
+        "attempts": 6,
+        "history": history,
+        "hints_data": {"2": {"current_hint_index": 1, "awaiting_hint_response": False,
+                             "hint_taken_for_score": True, "attempts_at_last_offer": 5}},
+    }
+
+
+def verbatim_session(coded):
+    return dict(coded, history=[messages.expand(entry, LEVELS) for entry in coded["history"]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="session encoding benchmark")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    payload = TaggedJSONSerializer()
+    with app.test_request_context():
+        cookie = SecureCookieSessionInterface().get_signing_serializer(app)
+
+    coded = coded_session()
+    sessions = {"verbatim": verbatim_session(coded), "coded": coded}
+    print(f"{'format':<10}{'payload B':>11}{'cookie B':>10}{'dumps us':>10}{'loads us':>10}{'cookie rt us':>14}")
+    for name, data in sessions.items():
+        dumped = payload.dumps(data)
+        signed = cookie.dumps(data)
+        dumps = timeit.timeit(lambda: payload.dumps(data), number=args.number) / args.number * 1e6
+        loads = timeit.timeit(lambda: payload.loads(dumped), number=args.number) / args.number * 1e6
+        round_trip = timeit.timeit(lambda: cookie.loads(cookie.dumps(data)), number=args.number) / args.number * 1e6
+        print(f"{name:<10}{len(dumped.encode()):>11}{len(signed):>10}{dumps:>10.1f}{loads:>10.1f}{round_trip:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
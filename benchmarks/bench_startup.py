@@ -0,0 +1,107 @@
+# Startup cost of the old gunicorn command line vs. gunicorn.conf.py (preload,
+# warm-up and gc.freeze() before fork): time until the first request succeeds,
+# and resident memory per worker after serving some traffic, from
+# /proc/<pid>/smaps_rollup. PSS splits shared pages between the processes sharing
+# them, so it is the number that drops when workers share the master's pages.
+# Linux only.
+#
+#   python benchmarks/bench_startup.py [--workers 3] [--requests 300] [--runs 3]
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+MODES = {
+    # gunicorn reads ./gunicorn.conf.py by default, so the old command line needs
+    # an explicitly empty config to behave as it did before
+    'plain': lambda port, workers, tmp: ['-c', os.path.join(tmp, 'empty.conf.py'), 'app:app',
+                                         '--workers', str(workers), '--bind', f'127.0.0.1:{port}'],
+    'config': lambda port, workers, tmp: ['-c', 'gunicorn.conf.py', 'app:app', '--bind', f'127.0.0.1:{port}'],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def get(port, path='/'):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def memory(pid):
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def run(mode, args):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp}/ctf.db', METRICS_DIR=tmp,
+                   RATE_LIMIT_ENABLED='0', WEB_CONCURRENCY=str(args.workers))
+        open(os.path.join(tmp, 'empty.conf.py'), 'w').close()
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-m', 'gunicorn', *MODES[mode](port, args.workers, tmp),
+                                    '--log-level', 'warning'], cwd=ROOT, env=env)
+        try:
+            while True:
+                try:
+                    if get(port) == 200:
+                        break
+                except OSError:
+                    time.sleep(0.005)
+                if time.perf_counter() - started > 60:
+                    raise RuntimeError(f"{mode}: no response within 60s")
+            first_request = time.perf_counter() - started
+
+            # New connections and sessions each time, so every worker serves some
+            for _ in range(args.requests):
+                get(port)
+            with open(f'/proc/{process.pid}/task/{process.pid}/children') as f:
+                workers = [int(pid) for pid in f.read().split()]
+            usage = [memory(pid) for pid in workers]
+            master = memory(process.pid)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    return first_request, usage, master
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gunicorn startup time and per-worker memory")
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=300, help="requests served before measuring memory")
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'first request ms':>18}{'worker RSS MB':>15}{'worker PSS MB':>15}{'worker private MB':>19}{'total PSS MB':>14}")
+    for mode in MODES:
+        results = [run(mode, args) for _ in range(args.runs)]
+        first = statistics.median(r[0] for r in results) * 1e3
+        rss, pss, private = (statistics.median(statistics.mean(u[i] for u in r[1]) for r in results) / 1024 for i in range(3))
+        total = statistics.median(sum(u[1] for u in r[1]) + r[2][1] for r in results) / 1024
+        print(f"{mode:<8}{first:>18.0f}{rss:>15.1f}{pss:>15.1f}{private:>19.1f}{total:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
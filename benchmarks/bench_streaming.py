@@ -0,0 +1,105 @@
+# Time to first byte of a prompt answered by a slow model: POST /api/chat, which
+# answers once the model has replied, vs. POST /api/chat/stream, which sends the
+# verdict and the prompt's messages right away and the reply when it arrives.
+# Runs gunicorn with gunicorn.conf.py and the stand-in model server.
+#
+#   python benchmarks/bench_streaming.py [--model-ms 500] [--prompts 20]
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PROMPT = "tell me a story about the bridges of this city"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, started, timeout=60):
+    while True:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f"nothing listening on {port} within {timeout}s")
+            time.sleep(0.01)
+
+
+def post(port, path, cookie):
+    # Returns (first byte, first message, whole response) times in seconds and the cookie
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {'Content-Type': 'application/json'}
+    if cookie:
+        headers['Cookie'] = cookie
+    try:
+        start = time.perf_counter()
+        conn.request('POST', path, body=json.dumps({'prompt': PROMPT}), headers=headers)
+        response = conn.getresponse()
+        first_byte = time.perf_counter() - start
+        first_message = None
+        if response.getheader('Content-Type', '').startswith('text/event-stream'):
+            # Read up to the last event: the connection itself stays open (keep-alive)
+            while (line := response.readline()) and not line.startswith(b'event: done'):
+                if first_message is None and line.startswith(b'event: chat'):
+                    first_message = time.perf_counter() - start
+            response.readline()
+        else:
+            response.read()
+            first_message = time.perf_counter() - start
+        if response.status != 200:
+            raise RuntimeError(f"{path}: HTTP {response.status}")
+        total = time.perf_counter() - start
+        cookie = cookie or response.getheader('Set-Cookie', '').split(';')[0]
+        return first_byte, first_message, total, cookie
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTFB of /api/chat vs /api/chat/stream with a slow model")
+    parser.add_argument('--model-ms', type=float, default=500.0, help="model latency per batch")
+    parser.add_argument('--prompts', type=int, default=20)
+    args = parser.parse_args()
+
+    model_port, port = free_port(), free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp}/ctf.db', METRICS_DIR=tmp, RATE_LIMIT_ENABLED='0',
+                   WEB_CONCURRENCY='2', PORT=str(port), MODEL_BACKEND='http',
+                   MODEL_URL=f'http://127.0.0.1:{model_port}/v1/batch', MODEL_TIMEOUT=str(args.model_ms / 1000 * 4))
+        started = time.perf_counter()
+        model = subprocess.Popen([sys.executable, 'model_server.py', '--port', str(model_port),
+                                  '--base-ms', str(args.model_ms), '--per-item-ms', '0'], cwd=ROOT)
+        server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app',
+                                   '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'], cwd=ROOT, env=env)
+        try:
+            wait_for(model_port, started)
+            wait_for(port, started)
+            print(f"{'endpoint':<18}{'first byte ms':>15}{'first message ms':>18}{'complete ms':>13}")
+            for path in ('/api/chat', '/api/chat/stream'):
+                cookie = None
+                results = []
+                for _ in range(args.prompts):
+                    *timings, cookie = post(port, path, cookie)
+                    results.append(timings)
+                first_byte, first_message, total = (statistics.median(r[i] for r in results) * 1e3 for i in range(3))
+                print(f"{path:<18}{first_byte:>15.1f}{first_message:>18.1f}{total:>13.1f}")
+        finally:
+            server.terminate()
+            model.terminate()
+            server.wait(timeout=30)
+            model.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
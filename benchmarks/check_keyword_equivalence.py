@@ -0,0 +1,93 @@
+# Checks that the compiled keyword rules give the same verdicts as the plain
+# substring tests they replaced ("password" in prompt.lower(), any(word in ...)),
+# for every level in the current level packs. Run it after editing keywords or
+# matcher.py; it exits with status 1 and prints the first prompt that differs.
+#
+#   python benchmarks/check_keyword_equivalence.py [--prompts 200000] [--seed 0]
+#
+# Prompts are built from the keywords themselves, their prefixes and suffixes
+# (so keywords overlap and nest, which is what the matcher's closure and overlap
+# masks are for), separators and a few characters that change under lower().
+# A second pass does the same with random keyword sets over a two-letter
+# alphabet, where nearly every keyword overlaps another.
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from matcher import KeywordMatcher  # noqa: E402
+from rules import GENERAL_EXFIL_KEYWORDS, LEVELS, keyword_flags  # noqa: E402
+
+SEPARATORS = ['', '', ' ', '  ', '\n', '\t', '-', '.']
+ODD = ['İ', 'ß', 'K', 'Σ', 'x', 'A', '1']
+
+
+def reference_flags(level, lowered):
+    # What the original lambdas and index() computed, one substring test each
+    exfil = any(word in lowered for word in GENERAL_EXFIL_KEYWORDS) and "password" in lowered
+    solved = (all(any(word in lowered for word in group) for group in level["require"])
+              and not any(word in lowered for word in level["forbid"]))
+    return exfil, solved, "password" in lowered, "hint" in lowered
+
+
+def fragments(keywords):
+    pieces = set(keywords)
+    for k in keywords:
+        for i in range(1, len(k)):
+            pieces.add(k[:i])
+            pieces.add(k[i:])
+    return sorted(pieces) + ODD
+
+
+def prompt(rng, pieces, upper=True):
+    text = ''.join(rng.choice(pieces) + rng.choice(SEPARATORS) for _ in range(rng.randint(1, 8)))
+    return text.upper() if upper and rng.random() < 0.2 else text
+
+
+def check_levels(rng, count):
+    levels = {number: LEVELS[number] for number in LEVELS}
+    keywords = {"password", "hint", *GENERAL_EXFIL_KEYWORDS}
+    for level in levels.values():
+        keywords.update(word for group in level["require"] + [level["forbid"]] for word in group)
+    pieces = fragments(sorted(keywords))
+    for _ in range(count):
+        lowered = prompt(rng, pieces).lower()
+        for number, level in levels.items():
+            expected = reference_flags(level, lowered)
+            if keyword_flags(number, lowered) != expected:
+                return f"level {number}, prompt {lowered!r}: got {keyword_flags(number, lowered)}, expected {expected}"
+    return None
+
+
+def check_matcher(rng, count):
+    for _ in range(count // 100):
+        keywords = sorted({''.join(rng.choice('ab') for _ in range(rng.randint(1, 5))) for _ in range(rng.randint(1, 8))})
+        matcher = KeywordMatcher(keywords)
+        pieces = fragments(keywords)
+        for _ in range(100):
+            text = prompt(rng, pieces, upper=False)
+            expected = matcher.mask(k for k in keywords if k in text)
+            if matcher.scan(text) != expected:
+                return f"keywords {keywords}, text {text!r}: got {matcher.scan(text):b}, expected {expected:b}"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compiled keyword rules vs. plain substring tests")
+    parser.add_argument('--prompts', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for name, check in (('level rules', check_levels), ('matcher', check_matcher)):
+        failure = check(rng, args.prompts)
+        if failure:
+            print(f"{name}: MISMATCH {failure}")
+            sys.exit(1)
+        print(f"{name}: {args.prompts} prompts, no differences")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Offline batch evaluator: replays a JSONL corpus of player prompts through the
+# same filter chain index() uses and writes one verdict per prompt.
+#
+#   python evaluate.py corpus.jsonl -o verdicts.jsonl --workers 8 --chunk-size 2000
+#
+# Each input line is {"level": 1, "prompt": "..."} plus any other fields (an "id",
+# a timestamp, ...), which are copied to the output unchanged. Each output line adds
+#   "branch": blocked_exfil | blocked_pattern | solved | not_solved | invalid
+#   "rule":   the suspicious pattern that fired (blocked_pattern only)
+#   "error":  why the record could not be evaluated (invalid only, which includes
+#             prompts over prompts.MAX_PROMPT_LENGTH that index() rejects too)
+# The hint yes/no exchange depends on session state and is not replayed.
+#
+# Input is read lazily and at most `workers * 2` chunks are in flight, so memory
+# stays bounded however large the corpus is; output keeps the input order.
+import argparse
+import collections
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from prompts import Prompt, PromptTooLong
+from rules import LEVELS, classify
+
+INVALID = 'invalid'
+
+
+def evaluate_record(record):
+    if not isinstance(record, dict) or 'level' not in record or 'prompt' not in record:
+        return {'branch': INVALID, 'error': "record needs 'level' and 'prompt'"}
+    level, prompt = record['level'], record['prompt']
+    # Type first: an unhashable level ([1], {...}) would raise in the lookup, and
+    # JSON true would pass for level 1
+    if not isinstance(level, int) or isinstance(level, bool) or level not in LEVELS or not isinstance(prompt, str):
+        return dict(record, branch=INVALID, error='unknown level or non-string prompt')
+    try:
+        prompt = Prompt(prompt)
+    except PromptTooLong as e:
+        return dict(record, branch=INVALID, error=str(e))
+    branch, rule = classify(level, prompt)
+    verdict = dict(record, branch=branch)
+    if rule:
+        verdict['rule'] = rule
+    return verdict
+
+
+def evaluate_lines(lines):
+    # Runs in the worker processes: parses and evaluates one chunk of JSONL lines,
+    # returning (branch, verdict JSON line) pairs
+    verdicts = []
+    for line in lines:
+        try:
+            verdict = evaluate_record(json.loads(line))
+        except ValueError as e:
+            verdict = {'branch': INVALID, 'error': f'bad JSON: {e}'}
+        verdicts.append((verdict['branch'], json.dumps(verdict, ensure_ascii=False)))
+    return verdicts
+
+
+def evaluate_stream(lines, workers=None, chunk_size=1000):
+    # Yields (branch, verdict JSON line) per non-blank input line, in input order.
+    # workers=1 evaluates in-process, which is handy for small corpora and tests.
+    lines = (line for line in lines if line.strip())
+    chunks = iter(lambda: list(islice(lines, chunk_size)), [])
+    if workers == 1:
+        for chunk in chunks:
+            yield from evaluate_lines(chunk)
+        return
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.submit(evaluate_lines, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a JSONL prompt corpus against the CTF level rules.")
+    parser.add_argument('corpus', help="JSONL file of {'level', 'prompt'} records, or - for stdin")
+    parser.add_argument('-o', '--output', default='-', help="where to write verdicts (default: stdout)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="prompts per batch sent to a worker")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.corpus == '-' else open(args.corpus, encoding='utf-8')
+    sink = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    counts = collections.Counter()
+    try:
+        for branch, verdict in evaluate_stream(source, workers=args.workers, chunk_size=args.chunk_size):
+            counts[branch] += 1
+            sink.write(verdict + '\n')
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    print(', '.join(f"{branch}: {n}" for branch, n in sorted(counts.items())), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# Production gunicorn settings:
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# The app is imported once in the master (preload_app), warmed up and its objects
+# frozen out of the garbage collector before the workers fork, so workers start
+# serving immediately and share those pages with the master instead of copying
+# them: the cyclic GC writes to every object it tracks, which would dirty every
+# inherited page on the first collection in each worker.
+import gc
+import glob
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8083)}"
+
+# WEB_CONCURRENCY (also what Render sets) wins; otherwise 2 per usable CPU + 1
+if hasattr(os, 'sched_getaffinity'):
+    cpus = len(os.sched_getaffinity(0))
+else:
+    cpus = os.cpu_count() or 1
+workers = int(os.environ.get('WEB_CONCURRENCY', cpus * 2 + 1))
+
+# Threads per worker, so a streamed reply (/api/chat/stream) waiting on the model
+# does not hold up the worker's other requests. Keep it above STREAM_SLOTS.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+preload_app = True
+
+
+def on_starting(server):
+    # Snapshots in an explicit METRICS_DIR belong to the previous deployment's
+    # workers; the default directory is already unique to this master.
+    directory = os.environ.get('METRICS_DIR')
+    if directory:
+        for path in glob.glob(os.path.join(directory, 'worker-*.json')):
+            os.remove(path)
+
+
+def when_ready(server):
+    # Runs in the master after the preload, right before the first workers fork
+    import app
+    app.warm_up()
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+# Level packs are JSON files in a directory next to a manifest.json listing which
+# pack holds which level numbers:
+#
+#   {"packs": [{"file": "city1.json", "levels": [1, 2, 3, 4, 5]}]}
+#
+# A pack defines its levels by number:
+#
+#   {"name": "City 1", "levels": {"1": {"password": "CTF{...}",
+#                                        "require": [["show", "print"], ...],
+#                                        "forbid": ["spell", "@general_exfil"],
+#                                        "hints": ["..."],
+#                                        "rate_limit": "0.5/5"}}}
+#
+# "rate_limit" is optional and overrides the per-session request limit (rate per
+# second / burst) for players on that level.
+#
+# "@name" inside a keyword group is replaced by the keyword list registered under
+# that name (see LevelRegistry's `references`).
+
+
+class LevelPackError(ValueError):
+    pass
+
+
+class LevelRegistry(Mapping):
+    # Read-only mapping of level number -> compiled level, loaded from level packs.
+    #
+    # Only the manifest is read up front; a pack is read and compiled by `compile`
+    # the first time one of its levels is looked up. At most every `check_interval`
+    # seconds a lookup also checks the manifest and the loaded packs for changes and
+    # recompiles what changed. The manifest index and the packs are swapped in
+    # together with a single reference assignment, only once everything new has
+    # compiled, so requests already holding a level keep using the old one, and a
+    # manifest or pack that fails to load or validate is logged and the old levels
+    # kept. A pack that fails on its first load has nothing to fall back to: its
+    # levels raise LevelPackError until the file changes.
+    #
+    # Every compiled level gets a "version" that changes with its pack's contents.
+
+    def __init__(self, directory, compile, references=None, check_interval=2.0):
+        self.directory = directory
+        self.compile = compile
+        self.references = references or {}
+        self.check_interval = check_interval
+        self._lock = threading.Lock() # serializes loading; lookups never take it
+        # (manifest index {number: file}, packs {file: (stamp, {number: level})}),
+        # one tuple so readers never pair an index with packs from another manifest
+        self._state = (self._read_manifest(), {})
+        self._manifest_stamp = _stamp(self._path('manifest.json'))
+        self._failed = {} # file -> stamp (or manifest key) that failed, so it is logged once
+        self._next_check = time.monotonic() + check_interval
+
+    def __getitem__(self, number):
+        self._maybe_reload()
+        index, packs = self._state
+        file = index[number]
+        pack = packs.get(file)
+        if pack is None:
+            pack = self._load(file)
+        return pack[1][number]
+
+    def __contains__(self, number):
+        return number in self._state[0]
+
+    def __iter__(self):
+        return iter(sorted(self._state[0]))
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def _path(self, file):
+        return os.path.join(self.directory, file)
+
+    def _read_manifest(self):
+        with open(self._path('manifest.json'), 'rb') as f:
+            manifest = json.load(f)
+        index = {}
+        for entry in manifest['packs']:
+            for number in entry['levels']:
+                if number in index:
+                    raise LevelPackError(f"Level {number} is listed in both {index[number]} and {entry['file']}")
+                index[number] = entry['file']
+        # index() moves players on by incrementing the level, so levels run 1..N
+        if sorted(index) != list(range(1, len(index) + 1)):
+            raise LevelPackError(f"Levels must be numbered 1..N, got {sorted(index)}")
+        return index
+
+    def _load(self, file):
+        with self._lock:
+            index, packs = self._state
+            pack = packs.get(file)
+            if pack is not None:
+                return pack
+            stamp = _stamp(self._path(file))
+            if self._failed.get(file) == stamp:
+                raise LevelPackError(f"{file} failed to load and has not changed since")
+            try:
+                pack = self._compile(file, stamp, index)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.error("Level pack %s did not load: %s", file, e)
+                self._failed[file] = stamp
+                raise LevelPackError(f"{file} did not load: {e}") from e
+            self._state = (index, dict(packs, **{file: pack}))
+            return pack
+
+    def _compile(self, file, stamp, index):
+        with open(self._path(file), 'rb') as f:
+            source = f.read()
+        definition = json.loads(source)
+        version = hashlib.sha256(source + json.dumps(self.references, sort_keys=True).encode()).hexdigest()[:16]
+
+        levels = {}
+        for key, level in definition['levels'].items():
+            for field in ('password', 'require', 'forbid', 'hints'):
+                if field not in level:
+                    raise LevelPackError(f"{file}: level {key} has no {field!r}")
+            level = dict(level,
+                         require=[self._expand(file, group) for group in level['require']],
+                         forbid=self._expand(file, level['forbid']),
+                         version=version)
+            levels[int(key)] = level
+        expected = {number for number, pack_file in index.items() if pack_file == file}
+        if set(levels) != expected:
+            raise LevelPackError(f"{file} defines levels {sorted(levels)}, the manifest lists {sorted(expected)}")
+        return stamp, self.compile(levels)
+
+    def _expand(self, file, group):
+        words = []
+        for word in group:
+            if word.startswith('@'):
+                if word[1:] not in self.references:
+                    raise LevelPackError(f"{file}: unknown keyword list {word}")
+                words.extend(self.references[word[1:]])
+            else:
+                words.append(word)
+        return words
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        if not self._lock.acquire(blocking=False):
+            return # another thread is already checking
+        try:
+            index, packs = self._state
+            stamp = _stamp(self._path('manifest.json'))
+            if stamp != self._manifest_stamp:
+                self._reload_manifest(stamp)
+                return
+
+            for file, (old_stamp, _) in packs.items():
+                stamp = _stamp(self._path(file))
+                if stamp == old_stamp or self._failed.get(file) == stamp:
+                    continue
+                try:
+                    packs = dict(packs, **{file: self._compile(file, stamp, index)})
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.error("Keeping the current version of %s: %s", file, e)
+                    self._failed[file] = stamp
+                else:
+                    logger.info("Reloaded level pack %s", file)
+            self._state = (index, packs)
+        finally:
+            self._lock.release()
+
+    def _reload_manifest(self, stamp):
+        # Every pack the new manifest lists is compiled against it before anything
+        # is swapped in; until then the current manifest and packs stay in use. A
+        # failure is remembered with the stamps of all the files involved, so fixing
+        # any one of them triggers another attempt.
+        try:
+            index = self._read_manifest()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if self._failed.get('manifest.json') != stamp:
+                logger.error("Keeping the current levels: manifest.json did not load: %s", e)
+                self._failed['manifest.json'] = stamp
+            return
+
+        files = sorted(set(index.values()))
+        key = (stamp, tuple(_stamp(self._path(file)) for file in files))
+        if self._failed.get('manifest.json') == key:
+            return
+        new_packs = {}
+        for file, file_stamp in zip(files, key[1]):
+            try:
+                new_packs[file] = self._compile(file, file_stamp, index)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.error("Keeping the current levels: %s did not load for the new manifest.json: %s", file, e)
+                self._failed['manifest.json'] = key
+                return
+        self._state = (index, new_packs)
+        self._manifest_stamp = stamp
+        logger.info("Reloaded manifest.json: %d levels", len(index))
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
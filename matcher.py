@@ -0,0 +1,70 @@
+import re
+
+
+class KeywordMatcher:
+    # Compiles a keyword list into one trie-shaped regex so a (lowercased) prompt
+    # is scanned once and every keyword it contains comes back as a bit in an int.
+    #
+    # The regex returns the longest keyword at each match position and then resumes
+    # after it, so two kinds of keyword can hide behind a match:
+    #   * keywords inside the match ("cred" in "credential", "show" in "show me"),
+    #     recovered through a precomputed closure mask;
+    #   * keywords that start inside the match and run past its end ("key" after
+    #     "ask" in "askey"), which are the only ones re-checked with a substring test.
+    # Together this makes the hit set exactly the keywords `k` for which `k in text`.
+
+    def __init__(self, keywords):
+        self.keywords = tuple(dict.fromkeys(k.lower() for k in keywords))
+        self.bits = {k: 1 << i for i, k in enumerate(self.keywords)}
+        self._closure = {
+            k: self.mask(other for other in self.keywords if other in k)
+            for k in self.keywords
+        }
+        self._overlaps = {k: self._overlapping(k) for k in self.keywords}
+        self._regex = re.compile(self._trie_pattern(self.keywords))
+
+    def mask(self, keywords):
+        bits = 0
+        for k in keywords:
+            bits |= self.bits[k.lower()]
+        return bits
+
+    def scan(self, text):
+        # `text` must already be lowercased; the caller does that once per prompt
+        hits = 0
+        candidates = set()
+        closure = self._closure
+        for found in set(self._regex.findall(text)):
+            hits |= closure[found]
+            candidates.update(self._overlaps[found])
+        for k in candidates:
+            if not hits & self.bits[k] and k in text:
+                hits |= closure[k]
+        return hits
+
+    def _overlapping(self, keyword):
+        # Keywords that can start strictly inside `keyword` and extend beyond it
+        return tuple(
+            k for k in self.keywords
+            if any(len(k) > len(keyword) - i and k.startswith(keyword[i:]) for i in range(1, len(keyword)))
+        )
+
+    @staticmethod
+    def _trie_pattern(keywords):
+        trie = {}
+        for k in keywords:
+            node = trie
+            for ch in k:
+                node = node.setdefault(ch, {})
+            node[""] = True
+
+        def build(node):
+            terminal = "" in node
+            branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+            if not branches:
+                return ""
+            body = branches[0] if len(branches) == 1 else "(?:%s)" % "|".join(branches)
+            # Optional continuation is greedy, so the longest keyword wins
+            return "(?:%s)?" % body if terminal else body
+
+        return build(trie)
@@ -0,0 +1,87 @@
+# Canned assistant messages. Session history stores these by code instead of as
+# full strings and only expands them when the chat is rendered:
+#   "text"            -> user message (already escaped)
+#   CODE              -> canned assistant message
+#   [CODE, arg, ...]  -> assistant message with arguments
+# ("user"/"assistant", text) pairs from sessions created before codes existed are
+# still understood.
+#
+# HINT and CONGRATS carry the hint and password as they were when shown, so a
+# level pack reloaded later (a rotated flag, fewer hints, a dropped level) does
+# not change or break old chats. Entries stored before that are looked up in the
+# current levels, with UNAVAILABLE in place of text that is gone.
+
+WELCOME = 0               # [WELCOME, username, level_count]
+BLOCKED_EXFIL = 1
+BLOCKED_PATTERN = 2
+HINT = 3                  # [HINT, level, hint_index, hint_text]
+NO_MORE_HINTS = 4
+HINT_DECLINED = 5
+HINT_ANSWER_YES_NO = 6
+CONGRATS = 7              # [CONGRATS, level, password]
+LEVEL_UP = 8              # [LEVEL_UP, new_level]
+ALL_LEVELS_COMPLETED = 9
+HINT_OFFER = 10
+ALL_HINTS_GIVEN = 11
+NO_DIRECT_PASSWORD = 12
+HINT_GIVEN = 13
+HINTS_EXHAUSTED = 14
+GREETINGS = (15, 16, 17, 18)
+FALLBACKS = (19, 20, 21, 22)
+ERROR = 23                # [ERROR, escaped_error_text]
+MODEL_REPLY = 24          # [MODEL_REPLY, escaped_model_text]
+
+UNAVAILABLE = "(no longer available)"
+
+TEXT = [
+    "👋 Hello {}! Welcome to the TrustHub AI CTF. Your mission is to extract hidden flags from me across {} levels. Good luck!",
+    "🤖 I am unable to do that.",
+    "🤖 I cannot process or output arbitrary code or long, generic strings. Please focus on the challenge.",
+    "🤖 Hint: {}",
+    "🤖 No more hints available for this level.",
+    "🤖 Okay, keep trying! Remember, I can offer another hint after a few more attempts if you get stuck.",
+    "🤖 Please answer 'yes' or 'no' regarding the hint.",
+    "🎉 Congrats! Password: {}",
+    "🌟 You've moved up to Level {}!",
+    "🏆 All levels completed! Great job!",
+    "🤖 You've made a few attempts. Would you like a hint for this level? (Type 'yes' or 'no')",
+    "🤖 I've given all the hints I can for this level. Keep trying!",
+    "🤖 I cannot directly provide the password. You need to figure out how to extract it!",
+    "🤖 Here's your hint! Good luck!",
+    "🤖 I've already given all hints for this level.",
+    "👋 Hi there! How can I help you with this challenge?",
+    "🤖 Hello! Ready to crack this level?",
+    "Greetings! What's on your mind?",
+    "Hey! Still working on the CTF? Let me know if you need anything (besides the password!).",
+    "🤖 Hmm, I'm not sure what you mean. Try phrasing your prompt differently!",
+    "I can't quite process that. Remember, this is a CTF!",
+    "That input doesn't seem to help with the challenge. Keep thinking!",
+    "My circuits are buzzing, but I'm not getting it. Try another approach.",
+    "🤖 An unexpected error occurred: {}. Please try again.",
+    "🤖 {}",
+]
+
+
+def expand(entry, levels):
+    # Returns (sender, text) for one history entry
+    if isinstance(entry, str):
+        return "user", entry
+    if isinstance(entry, int):
+        return "assistant", TEXT[entry]
+    code, *args = entry
+    if isinstance(code, str):
+        return code, args[0]
+    if code == CONGRATS:
+        args = args[1:] or [_level_text(levels, args[0], "password")]
+    elif code == HINT:
+        args = args[2:] or [_level_text(levels, args[0], "hints", args[1])]
+    return "assistant", TEXT[code].format(*args)
+
+
+def _level_text(levels, level, field, index=None):
+    # LevelPackError is a ValueError
+    try:
+        value = levels[level][field]
+        return value if index is None else value[index]
+    except (KeyError, IndexError, ValueError):
+        return UNAVAILABLE
@@ -0,0 +1,216 @@
+import atexit
+import bisect
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds, 10us .. 1s
+BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)
+
+HELP = {
+    'ctf_stage_seconds': ('histogram', "Time spent in each stage of a chat request."),
+    'ctf_verdicts_total': ('counter', "Prompts evaluated, by level and branch of the filter chain."),
+    'ctf_hint_offers_total': ('counter', "Hint offers made, by level."),
+    'ctf_level_completions_total': ('counter', "Levels completed, by level."),
+    'ctf_rate_limited_total': ('counter', "Requests rejected by the rate limiter, by the bucket that ran out (session, address)."),
+    'ctf_model_replies_total': ('counter', "Prompts sent to the model backend, by outcome (model, timeout, error)."),
+    'ctf_verdict_cache_total': ('counter', "Keyword verdict cache lookups, by result (hit, shared_hit, miss)."),
+    'ctf_streams_total': ('counter', "Reply streams, by how they ended (completed, abandoned, rejected)."),
+}
+
+
+class _Stage:
+    __slots__ = ('metrics', 'key', 'start')
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.metrics.observe_key(self.key, time.perf_counter() - self.start)
+
+
+class _NullStage:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+class Metrics:
+    # In-process counters and histograms exported in Prometheus text format.
+    #
+    # Each process (gunicorn worker) keeps its own values and writes a snapshot to
+    # `directory` at most every `flush_interval` seconds; /metrics merges the
+    # snapshots of all workers, so any worker can answer a scrape. Changes that a
+    # request could not write yet are written by a background thread, so a worker
+    # that goes idle still publishes its last requests. When disabled,
+    # stage() hands out a shared no-op context manager and the counters do nothing.
+
+    def __init__(self, enabled=True, directory=None, flush_interval=1.0):
+        self.enabled = enabled
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._counters = {}
+        self._histograms = {}
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._next_flush = 0.0
+        self._dirty = False
+        self._flusher_pid = None
+        if not enabled:
+            self.stage = lambda name: NULL_STAGE
+            self.inc = lambda name, **labels: None
+            self.flush = lambda force=False: None
+
+    # The hot-path updates below take no lock: under the GIL a thread switch between
+    # read and write can at worst drop a single increment, which is acceptable for
+    # monitoring and keeps each update well under a microsecond.
+
+    def stage(self, name):
+        # Times a block of code into ctf_stage_seconds{stage=name}
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = ('ctf_stage_seconds', (('stage', name),))
+        return _Stage(self, stage)
+
+    def observe_key(self, key, seconds):
+        buckets = self._histograms.get(key)
+        if buckets is None:
+            # One count per bucket, then +Inf, then the sum
+            buckets = self._histograms.setdefault(key, [0] * (len(BUCKETS) + 1) + [0.0])
+        buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        buckets[-1] += seconds
+
+    def inc(self, name, **labels):
+        # Callers pass labels in a consistent order; values are stringified on export
+        key = (name, tuple(labels.items()))
+        self._counters[key] = self._counters.get(key, 0) + 1
+
+    def flush(self, force=False):
+        # Writes this process's snapshot; cheap to call after every request. Within
+        # `flush_interval` of the last write it only marks the snapshot stale for
+        # the flusher thread.
+        now = time.monotonic()
+        if not force and now < self._next_flush:
+            self._dirty = True
+            self._ensure_flusher()
+            return
+        self._next_flush = now + self.flush_interval
+        self._dirty = False
+        # Held while writing, so an older snapshot never replaces a newer one
+        with self._lock:
+            snapshot = {
+                'counters': [[name, labels, value] for (name, labels), value in list(self._counters.items())],
+                'histograms': [[name, labels, list(values)] for (name, labels), values in list(self._histograms.items())],
+            }
+            path = os.path.join(self._directory(), f'worker-{os.getpid()}.json')
+            tmp = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, path)
+
+    def _ensure_flusher(self):
+        # Started lazily and per process, like AttemptLog's writer: a thread
+        # started before gunicorn forks does not exist in the workers.
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            threading.Thread(target=self._run_flusher, name='metrics-flush', daemon=True).start()
+            self._flusher_pid = os.getpid()
+            atexit.register(self.flush, force=True)
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush(force=True)
+
+    def render(self):
+        if not self.enabled:
+            return "# metrics disabled\n"
+        self.flush(force=True)
+        counters, histograms = {}, {}
+        directory = self._directory()
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue # a worker replaced it mid-read; its values show up next scrape
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple((k, str(v)) for k, v in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, [0] * len(values))
+                for i, v in enumerate(values):
+                    merged[i] += v
+
+        lines = []
+        for metric, (kind, text) in HELP.items():
+            lines.append(f"# HELP {metric} {text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), values in sorted(histograms.items()):
+                if name != metric:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), values):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {values[-1]}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def _directory(self):
+        # Under gunicorn every worker shares the master's pid as parent, so the
+        # default directory is common to one deployment and fresh for the next.
+        # Anywhere else (dev server, test client) the process is the deployment:
+        # its parent is a shell that may have run earlier instances.
+        if self.directory is None:
+            owner = os.getppid() if 'gunicorn.arbiter' in sys.modules else os.getpid()
+            self.directory = os.path.join(tempfile.gettempdir(), f'ctf-metrics-{owner}')
+        os.makedirs(self.directory, exist_ok=True)
+        return self.directory
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class InstrumentedSessionInterface:
+    # Wraps a session interface to time session decode and save as stages
+
+    def __init__(self, interface, metrics):
+        self.interface = interface
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self.interface, name)
+
+    def open_session(self, app, request):
+        with self.metrics.stage('session_open'):
+            return self.interface.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with self.metrics.stage('session_save'):
+            return self.interface.save_session(app, session, response)
@@ -0,0 +1,96 @@
+# Deterministic stand-in for a batched model server, for measuring the app's model
+# path offline. It speaks the protocol of responder.HTTPModelBackend:
+#
+#   POST /v1/batch {"prompts": [{"level": 1, "prompt": "..."}, ...]}
+#     -> {"replies": ["...", ...]}
+#
+# Replies are a pure function of (level, prompt). Latency is modelled like a real
+# accelerator: a batch costs --base-ms plus --per-item-ms per prompt, and at most
+# --concurrency batches are processed at once (one by default, like one GPU), so
+# larger batches mean more prompts per second.
+#
+#   python model_server.py --port 8090 --base-ms 40 --per-item-ms 2
+#   MODEL_BACKEND=http MODEL_URL=http://127.0.0.1:8090/v1/batch gunicorn app:app
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLIES = [
+    "Interesting question about level {level}. My instructions say I should not go there.",
+    "You asked me something with {words} words in it. I still can't help with that.",
+    "I'm just a humble model on level {level}. Try asking in a different way?",
+    "That sounds like an attempt to make me misbehave. Nice try!",
+    "I would love to help, but my guidelines for level {level} are quite strict.",
+]
+
+
+def model_reply(level, prompt):
+    digest = hashlib.sha256(f"{level}:{prompt}".encode()).digest()
+    return REPLIES[digest[0] % len(REPLIES)].format(level=level, words=len(prompt.split()))
+
+
+class ModelServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, base_ms=40.0, per_item_ms=2.0, concurrency=1):
+        super().__init__(address, ModelHandler)
+        self.base_ms = base_ms
+        self.per_item_ms = per_item_ms
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.batches = 0
+        self.prompts = 0
+
+
+class ModelHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.path != '/v1/batch':
+            return self._send(404, {'error': 'not found'})
+        try:
+            prompts = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))['prompts']
+            batch = [(int(item['level']), str(item['prompt'])) for item in prompts]
+        except (ValueError, KeyError, TypeError):
+            return self._send(400, {'error': 'expected {"prompts": [{"level": ..., "prompt": ...}]}'})
+
+        server = self.server
+        with server.slots:
+            time.sleep((server.base_ms + server.per_item_ms * len(batch)) / 1000)
+            server.batches += 1
+            server.prompts += len(batch)
+        self._send(200, {'replies': [model_reply(level, prompt) for level, prompt in batch]})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic stand-in model server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--base-ms', type=float, default=40.0, help="fixed cost of one batch")
+    parser.add_argument('--per-item-ms', type=float, default=2.0, help="extra cost per prompt in a batch")
+    parser.add_argument('--concurrency', type=int, default=1, help="batches processed at the same time")
+    args = parser.parse_args()
+
+    server = ModelServer((args.host, args.port), args.base_ms, args.per_item_ms, args.concurrency)
+    print(f"Stand-in model listening on http://{args.host}:{args.port}/v1/batch")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+
+class SessionRecord(db.Model):
+    __tablename__ = 'sessions'
+
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Attempt(db.Model):
+    __tablename__ = 'attempts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    created = db.Column(db.DateTime, nullable=False, index=True)
+    session_id = db.Column(db.String(64), index=True)
+    level = db.Column(db.Integer, nullable=False)
+    prompt = db.Column(db.Text, nullable=False)
+    verdict = db.Column(db.String(32), nullable=False)
+    rule = db.Column(db.String(64))
+    hint_event = db.Column(db.String(16)) # offered, given, declined
+
+
+class AnalyticsCounter(db.Model):
+    # Running totals per level, e.g. ('solves', 3) -> 120. Level 0 holds totals
+    # that belong to no level.
+    __tablename__ = 'analytics_counters'
+
+    level = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False)
+
+
+class AnalyticsSketchBucket(db.Model):
+    # Bucket counts of the mergeable quantile sketches in analytics.py
+    __tablename__ = 'analytics_sketch_buckets'
+
+    level = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(32), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False)
@@ -0,0 +1,39 @@
+import re
+import unicodedata
+
+# Longest prompt, in characters, that is evaluated at all. Real prompts are a few
+# sentences; anything longer only costs matching time and session space.
+MAX_PROMPT_LENGTH = 1000
+
+WHITESPACE = re.compile(r'\s+')
+
+
+class PromptTooLong(ValueError):
+    pass
+
+
+class Prompt:
+    # One player prompt, normalized once for every check that follows:
+    #   raw     - as typed, minus surrounding whitespace (shown back and logged)
+    #   text    - NFKC-normalized, whitespace runs collapsed to one space
+    #             (case-sensitive checks: SUSPICIOUS_PATTERNS)
+    #   lowered - `text` lowercased (keyword rules, hint answers, greetings)
+    # NFKC folds compatibility characters such as fullwidth letters into plain
+    # ones, so "ｓｈｏｗ" is the keyword "show" and not a way around it.
+
+    __slots__ = ('raw', 'text', 'lowered')
+
+    def __init__(self, raw, max_length=MAX_PROMPT_LENGTH):
+        # Length is checked before any other work, and again after NFKC, which
+        # can expand a single character into many
+        if len(raw) > max_length:
+            raise PromptTooLong(f"Prompts are limited to {max_length} characters")
+        self.raw = raw.strip()
+        text = unicodedata.normalize('NFKC', self.raw)
+        if len(text) > max_length:
+            raise PromptTooLong(f"Prompts are limited to {max_length} characters")
+        self.text = WHITESPACE.sub(' ', text).strip()
+        self.lowered = self.text.lower()
+
+    def __bool__(self):
+        return bool(self.raw)
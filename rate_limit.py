@@ -0,0 +1,183 @@
+import functools
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from werkzeug.http import parse_cookie
+
+logger = logging.getLogger(__name__)
+
+SESSION = 'session'
+ADDRESS = 'address'
+
+
+@functools.lru_cache(maxsize=64)
+def parse_limit(spec):
+    # "rate/burst": `rate` requests per second on average, bursts of up to `burst`
+    rate, _, burst = str(spec).partition('/')
+    rate, burst = float(rate), float(burst or rate)
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"Invalid rate limit {spec!r}, expected rate/burst like '1/10'")
+    return rate, burst
+
+
+class RateLimiter:
+    # Token buckets kept in a SQLite file, so every gunicorn worker draws from the
+    # same budget. A request takes one token from its session bucket and one from
+    # its client address bucket inside one IMMEDIATE transaction.
+    #
+    # The session bucket remembers the player's level (set_level()), and
+    # `level_limit(level)` may return a stricter or looser "rate/burst" for it. A
+    # bucket without a recorded level is on `first_level`, where every session
+    # starts. Buckets idle long enough to have refilled are purged unless they
+    # carry a level, which is kept for `max_idle` seconds (the session lifetime).
+    #
+    # The address bucket is shared by everyone behind one address (a venue or
+    # campus NAT), so its limit should be generous; `address_limit` None or 'off'
+    # drops it and leaves requests without a session cookie unlimited.
+    #
+    # When the file cannot be used the limiter fails open and logs the error.
+
+    def __init__(self, path, session_limit='1/10', address_limit='50/500', level_limit=None,
+                 first_level=1, max_idle=31 * 24 * 3600, purge_interval=60.0):
+        self.path = path
+        self.session_limit = parse_limit(session_limit)
+        self.address_limit = None if address_limit in (None, '', 'off') else parse_limit(address_limit)
+        self.level_limit = level_limit
+        self.first_level = first_level
+        self.max_idle = max_idle
+        self.purge_interval = purge_interval
+        self.dropped = {SESSION: 0, ADDRESS: 0}
+        limits = [self.session_limit] + ([self.address_limit] if self.address_limit else [])
+        self._refill_time = max(burst / rate for rate, burst in limits)
+        self._next_purge = 0.0
+        self._local = threading.local()
+
+    def hit(self, session_id, address):
+        # Takes a token for this request. Returns None when it may proceed, or
+        # (scope, seconds until a token is available) when it is rejected.
+        now = time.time()
+        buckets = []
+        if session_id:
+            buckets.append((SESSION, self.session_key(session_id)))
+        if self.address_limit:
+            buckets.append((ADDRESS, 'ip:' + address))
+        if not buckets:
+            return None
+        try:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                updates = []
+                for scope, key in buckets:
+                    row = conn.execute('SELECT tokens, updated, level FROM buckets WHERE key = ?', (key,)).fetchone()
+                    rate, burst = self._limit(scope, row[2] if row else None)
+                    tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                    if tokens < 1:
+                        conn.execute('ROLLBACK')
+                        self.dropped[scope] += 1
+                        return scope, (1 - tokens) / rate
+                    updates.append((key, tokens - 1, now))
+                conn.executemany(
+                    'INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                    updates,
+                )
+                self._purge(conn, now)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error:
+            logger.exception("Rate limiter unavailable, letting the request through")
+        return None
+
+    def set_level(self, session_id, level):
+        # Called by the app with the player's level once the session has an id
+        try:
+            self._connection().execute('UPDATE buckets SET level = ? WHERE key = ?', (level, self.session_key(session_id)))
+        except sqlite3.Error:
+            logger.exception("Could not record the level of a rate limit bucket")
+
+    def session_key(self, session_id):
+        # Hashed so a huge or hostile cookie value still makes a short key
+        return 'sid:' + hashlib.sha256(session_id.encode()).hexdigest()[:32]
+
+    def _limit(self, scope, level):
+        if scope == ADDRESS:
+            return self.address_limit
+        if level is None:
+            level = self.first_level
+        if self.level_limit is not None:
+            spec = self.level_limit(level)
+            if spec:
+                try:
+                    return parse_limit(spec)
+                except ValueError:
+                    logger.error("Ignoring invalid rate_limit %r of level %s", spec, level)
+        return self.session_limit
+
+    def _purge(self, conn, now):
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        conn.execute('DELETE FROM buckets WHERE updated < ? AND (level IS NULL OR updated < ?)',
+                     (now - self._refill_time, now - self.max_idle))
+
+    def _connection(self):
+        # sqlite3 connections must not cross threads or a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF') # losing recent buckets in a crash is harmless
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets '
+                         '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, level INTEGER)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+
+class RateLimitMiddleware:
+    # WSGI middleware that runs the limiter before Flask sees the request, so a
+    # rejected request costs no session decode and no rule evaluation. Only `paths`
+    # are limited; static files and /metrics pass straight through.
+    #
+    # With `trusted_proxies` = N the client address is the Nth entry from the right
+    # of X-Forwarded-For (what N proxies in front of the app appended), otherwise
+    # the socket's peer address.
+
+    def __init__(self, wsgi_app, limiter, cookie_name, paths=('/',), trusted_proxies=0, on_reject=None):
+        self.wsgi_app = wsgi_app
+        self.limiter = limiter
+        self.cookie_name = cookie_name
+        self.paths = frozenset(paths)
+        self.trusted_proxies = trusted_proxies
+        self.on_reject = on_reject
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') in self.paths:
+            session_id = parse_cookie(environ.get('HTTP_COOKIE', '')).get(self.cookie_name)
+            rejected = self.limiter.hit(session_id, self.client_address(environ))
+            if rejected:
+                scope, retry_after = rejected
+                if self.on_reject is not None:
+                    self.on_reject(scope)
+                body = b"Too many requests, please slow down.\n"
+                start_response('429 Too Many Requests', [
+                    ('Content-Type', 'text/plain; charset=utf-8'),
+                    ('Content-Length', str(len(body))),
+                    ('Retry-After', str(max(1, math.ceil(retry_after)))),
+                ])
+                return [body]
+        return self.wsgi_app(environ, start_response)
+
+    def client_address(self, environ):
+        if self.trusted_proxies:
+            forwarded = [a.strip() for a in environ.get('HTTP_X_FORWARDED_FOR', '').split(',') if a.strip()]
+            if len(forwarded) >= self.trusted_proxies:
+                return forwarded[-self.trusted_proxies]
+        return environ.get('REMOTE_ADDR', '')
@@ -0,0 +1,180 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.request
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeout
+
+from markupsafe import escape
+
+import messages
+
+logger = logging.getLogger(__name__)
+
+
+class CannedResponder:
+    # The original behaviour: one of the canned fallback replies, picked at random.
+    # Responders return a history entry for the assistant's reply to a prompt that
+    # no filter or level rule handled.
+
+    def reply(self, level, prompt):
+        return random.choice(messages.FALLBACKS)
+
+    def close(self):
+        pass
+
+
+class HTTPModelBackend:
+    # Sends a batch of prompts in one POST and expects one reply per prompt:
+    #   request  {"prompts": [{"level": 1, "prompt": "..."}, ...]}
+    #   response {"replies": ["...", ...]}
+    # model_server.py implements this for local testing.
+
+    def __init__(self, url, timeout=10.0):
+        self.url = url
+        self.timeout = timeout
+
+    async def complete(self, batch):
+        # urllib blocks, so the request runs on the loop's default thread pool
+        return await asyncio.get_running_loop().run_in_executor(None, self._post, batch)
+
+    def _post(self, batch):
+        body = json.dumps({'prompts': [{'level': level, 'prompt': prompt} for level, prompt in batch]}).encode()
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            replies = json.load(response)['replies']
+        if len(replies) != len(batch):
+            raise ValueError(f"Model returned {len(replies)} replies for {len(batch)} prompts")
+        return replies
+
+
+class BatchingResponder:
+    # Puts a model backend behind the fallback branch.
+    #
+    # reply() is called from request threads. Prompts go onto an asyncio queue
+    # served by an event loop in a background thread, which gathers them into
+    # batches of up to `max_batch` prompts, waiting at most `max_wait` seconds after
+    # the first one, and keeps up to `max_in_flight` batches at the backend at once.
+    # A prompt without a model reply within `timeout` seconds, or whose batch
+    # failed, gets a canned reply from `fallback` instead, so a slow or broken
+    # model costs at most `timeout` per request.
+    #
+    # Batches form from requests a process is handling concurrently, so they grow
+    # with threaded workers (gunicorn --threads) and stay small under sync workers.
+
+    def __init__(self, backend, max_batch=16, max_wait=0.01, timeout=2.0, max_in_flight=4,
+                 fallback=None, on_result=None):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.fallback = fallback or CannedResponder()
+        self.on_result = on_result # called with 'model', 'timeout' or 'error' per prompt
+        self.batches = 0
+        self.batched_prompts = 0
+        self._loop = None
+        self._pid = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def reply(self, level, prompt):
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self._submit(level, prompt), loop)
+        try:
+            # The coroutine enforces the timeout; the margin covers a stalled loop
+            result, text = future.result(self.timeout + 1.0)
+        except (FutureTimeout, CancelledError):
+            future.cancel()
+            result, text = 'timeout', None
+        if self.on_result is not None:
+            self.on_result(result)
+        if text is None:
+            return self.fallback.reply(level, prompt)
+        return [messages.MODEL_REPLY, str(escape(text))]
+
+    def close(self, timeout=5.0):
+        if self._loop is not None and self._pid == os.getpid():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+            self._loop, self._pid = None, None
+
+    def _ensure_started(self):
+        # One loop thread per process, started lazily: threads do not survive the
+        # fork into gunicorn workers
+        if self._pid == os.getpid():
+            return self._loop
+        with self._start_lock:
+            if self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(loop, ready), name='model-batcher', daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop, self._pid = loop, os.getpid()
+                atexit.register(self.close)
+        return self._loop
+
+    def _run(self, loop, ready):
+        asyncio.set_event_loop(loop)
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        loop.create_task(self._collect())
+        loop.call_soon(ready.set)
+        loop.run_forever()
+        # Stopped by close(): prompts still waiting get the fallback reply
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
+
+    async def _submit(self, level, prompt):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((level, prompt, future))
+        try:
+            return 'model', await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            return 'timeout', None
+        except Exception:
+            return 'error', None
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Prompts that already timed out are not worth sending
+            batch = [item for item in batch if not item[2].done()]
+            if batch:
+                await self._slots.acquire()
+                asyncio.get_running_loop().create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        self.batches += 1
+        self.batched_prompts += len(batch)
+        try:
+            replies = await self.backend.complete([(level, prompt) for level, prompt, _ in batch])
+        except Exception as e:
+            logger.warning("Model batch of %d prompts failed: %s", len(batch), e)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, _, future), text in zip(batch, replies):
+                if not future.done():
+                    future.set_result(str(text))
+        finally:
+            self._slots.release()
@@ -0,0 +1,99 @@
+import os
+import re # Import re for regular expressions
+
+from level_packs import LevelRegistry
+from matcher import KeywordMatcher
+from patterns import SuspiciousScanner
+
+# Level definitions and the filter chain shared by the web app and the offline
+# evaluator (evaluate.py). Nothing here depends on Flask.
+
+# Define a general list of keywords that should never be directly outputted or manipulated for exfiltration
+GENERAL_EXFIL_KEYWORDS = ["spell", "rhyme", "reverse", "encode", "tell", "include", "output", "display", "show"]
+
+# Define suspicious patterns to block generic data extraction attempts
+SUSPICIOUS_PATTERNS = [
+    re.compile(r'[a-zA-Z0-9]{15,}'), # Blocks sequences of 15 or more alphanumeric chars
+    re.compile(r'print\s*\([^)]*\)'), # Blocks common print function calls
+    re.compile(r'exec\s*\([^)]*\)'),  # Blocks common exec function calls
+    re.compile(r'eval\s*\([^)]*\)'),  # Blocks common eval function calls
+    re.compile(r'import\s+'),         # Blocks import statements
+    re.compile(r'system\s*\('),       # Blocks system calls
+    re.compile(r'read\s*file'),       # Blocks file read attempts
+    re.compile(r'cat\s+'),            # Blocks cat command
+    re.compile(r'ls\s+'),             # Blocks ls command
+    re.compile(r'dir\s+'),            # Blocks dir command
+]
+
+# All SUSPICIOUS_PATTERNS evaluated by one linear-time scanner that reports the rule that fired
+SUSPICIOUS_SCANNER = SuspiciousScanner(SUSPICIOUS_PATTERNS)
+
+
+# CTF levels come from the level packs in LEVELS_DIR (levels/city1.json holds
+# City 1, levels 1-5). Each level passes when the prompt contains at least one
+# keyword from every "require" group and none of the "forbid" keywords
+# (case-insensitive substring match).
+LEVELS_DIR = os.environ.get('LEVELS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels'))
+
+
+def compile_pack(levels):
+    # Every keyword used by the filters and the pack's levels, compiled once so a
+    # prompt is lowercased and scanned a single time per request.
+    keywords = KeywordMatcher(
+        ["password", "hint", *GENERAL_EXFIL_KEYWORDS] +
+        [word for lvl in levels.values() for group in lvl["require"] + [lvl["forbid"]] for word in group]
+    )
+    password_mask = keywords.mask(["password"])
+    hint_mask = keywords.mask(["hint"])
+    general_exfil_mask = keywords.mask(GENERAL_EXFIL_KEYWORDS)
+
+    for level in levels.values():
+        compile_level(level, keywords, password_mask, hint_mask, general_exfil_mask)
+    return levels
+
+
+def compile_level(level, keywords, password_mask, hint_mask, general_exfil_mask):
+    require_masks = [keywords.mask(group) for group in level["require"]]
+    forbid_mask = keywords.mask(level["forbid"])
+
+    def verdict(hits):
+        return all(hits & mask for mask in require_masks) and not hits & forbid_mask
+
+    def flags(lowered):
+        hits = keywords.scan(lowered)
+        return (bool(hits & general_exfil_mask and hits & password_mask), verdict(hits),
+                bool(hits & password_mask), bool(hits & hint_mask))
+
+    level["flags"] = flags
+    level["check"] = lambda prompt: verdict(keywords.scan(prompt.lower()))
+
+
+LEVELS = LevelRegistry(
+    LEVELS_DIR, compile_pack,
+    references={"general_exfil": GENERAL_EXFIL_KEYWORDS},
+    check_interval=float(os.environ.get('LEVELS_RELOAD_INTERVAL', 2.0)),
+)
+
+# Branches of the filter chain, in the order index() applies them
+BLOCKED_EXFIL = 'blocked_exfil'
+BLOCKED_PATTERN = 'blocked_pattern'
+SOLVED = 'solved'
+NOT_SOLVED = 'not_solved'
+
+
+def keyword_flags(level, lowered):
+    # Everything the filter chain needs from the keyword scan of a lowercased prompt:
+    # (exfil blocked, level solved, mentions "password", mentions "hint")
+    return LEVELS[level]["flags"](lowered)
+
+
+def classify(level, prompt):
+    # Runs a prompts.Prompt through the session-independent part of index()'s
+    # filter chain. Returns (branch, suspicious rule or None).
+    blocked_exfil, solved, _, _ = keyword_flags(level, prompt.lowered)
+    if blocked_exfil:
+        return BLOCKED_EXFIL, None
+    rule = SUSPICIOUS_SCANNER.search(prompt.text)
+    if rule:
+        return BLOCKED_PATTERN, rule
+    return (SOLVED if solved else NOT_SOLVED), None
@@ -0,0 +1,165 @@
+import datetime
+import re
+import secrets
+import threading
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import delete
+from werkzeug.datastructures import CallbackDict
+
+from models import SessionRecord, db
+
+SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{43}$') # secrets.token_urlsafe(32)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    # Session whose data lives in a server-side store; the cookie only holds `sid`.
+    # `payload` is the serialized form it was loaded from, used to skip no-op writes.
+
+    def __init__(self, initial=None, sid=None, payload=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.payload = payload
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+
+class LRUSessionStore:
+    # In-process store for single-worker deployments; the least recently used
+    # sessions are evicted once `maxsize` is reached.
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        now = datetime.datetime.utcnow()
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return entry[0]
+
+    def save(self, sid, payload, expires):
+        with self._lock:
+            self._data[sid] = (payload, expires)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+
+class SQLSessionStore:
+    # Store backed by the app database, shared by every gunicorn worker.
+    # Expired rows are purged at most once per `purge_interval` per process.
+
+    def __init__(self, purge_interval=datetime.timedelta(minutes=10)):
+        self.purge_interval = purge_interval
+        self._next_purge = datetime.datetime.min
+
+    def load(self, sid):
+        record = db.session.get(SessionRecord, sid)
+        if record is None or record.expires <= datetime.datetime.utcnow():
+            return None
+        return record.data
+
+    def save(self, sid, payload, expires):
+        db.session.merge(SessionRecord(id=sid, data=payload, expires=expires))
+        self._purge_expired()
+        db.session.commit()
+
+    def delete(self, sid):
+        db.session.execute(delete(SessionRecord).where(SessionRecord.id == sid))
+        db.session.commit()
+
+    def _purge_expired(self):
+        now = datetime.datetime.utcnow()
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            db.session.execute(delete(SessionRecord).where(SessionRecord.expires <= now))
+
+
+class ServerSideSessionInterface(SessionInterface):
+    # Keeps session data in `store` and sends only a random session id in the
+    # cookie. A store write happens only when the serialized data actually changed.
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and SESSION_ID.match(sid):
+            payload = self.store.load(sid)
+            if payload is not None:
+                return ServerSession(self.serializer.loads(payload), sid=sid, payload=payload)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        # An emptied session is removed from the store and the cookie dropped
+        if not session:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+                response.vary.add('Cookie')
+            return
+
+        new_sid = session.sid is None
+        # Like Flask's cookie sessions, nested changes must set `session.modified`
+        payload = self.serializer.dumps(dict(session)) if session.modified or new_sid else session.payload
+        if payload != session.payload:
+            if new_sid:
+                session.sid = secrets.token_urlsafe(32)
+            # Server-side data is kept for the permanent lifetime since the last change
+            expires = datetime.datetime.utcnow() + app.permanent_session_lifetime
+            self.store.save(session.sid, payload, expires)
+            session.payload = payload
+
+        # The id never changes, so the cookie is only (re)sent for a new session or
+        # to refresh the expiry of a permanent one.
+        if new_sid or (session.permanent and app.config['SESSION_REFRESH_EACH_REQUEST']):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+            response.vary.add('Cookie')
@@ -0,0 +1,230 @@
+// Celebration burst when the page was rendered right after a solved level
+function celebrate() {
+    confetti({
+        particleCount: 100,
+        spread: 70,
+        origin: { y: 0.6 }
+    });
+    // You can add more bursts for a grander effect
+    setTimeout(() => {
+        confetti({
+            particleCount: 80,
+            spread: 80,
+            origin: { y: 0.5, x: 0.2 }
+        });
+    }, 200);
+    setTimeout(() => {
+        confetti({
+            particleCount: 80,
+            spread: 80,
+            origin: { y: 0.5, x: 0.8 }
+        });
+    }, 400);
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    if (document.body.dataset.celebrate === 'true') {
+        celebrate();
+    }
+});
+
+// Sends prompts through /api/chat/stream, which streams the reply, or /api/chat
+// when streams are unavailable, and appends only the new messages. Only when the
+// server cannot be reached or has no chat endpoint does it fall back to the
+// regular form POST, which re-renders the whole page. An error response is shown
+// in the chat instead: the prompt was rejected (resubmitting it would fail the
+// same way) or may already have been handled. A failure after a successful
+// response reloads the page, as the prompt has been handled.
+function appendMessage(container, message) {
+    const p = document.createElement('p');
+    const isUser = message.sender === 'user';
+    p.className = 'chat-message ' + (isUser ? 'user-message' : 'bot-message');
+    p.innerHTML = '<b>' + (isUser ? 'You' : 'Bot') + ':</b> ' + message.html;
+    container.appendChild(p);
+    return p;
+}
+
+function showHint(form, hint) {
+    const old = document.querySelector('.hint-box');
+    if (old) {
+        old.remove();
+    }
+    if (hint) {
+        const box = document.createElement('div');
+        box.className = 'hint-box';
+        box.innerHTML = '💡 Hint: ' + hint;
+        form.insertAdjacentElement('afterend', box);
+    }
+}
+
+// Shows why the server did not take a prompt, from the JSON "error" if there is one
+async function showError(container, response) {
+    let text = 'The prompt could not be processed (HTTP ' + response.status + '). Please try again.';
+    try {
+        const data = await response.json();
+        if (data.error) {
+            text = data.error;
+        }
+    } catch (err) {
+        // Not JSON, e.g. the 413 page for an oversized request body
+    }
+    const p = appendMessage(container, { sender: 'bot', html: '' });
+    p.appendChild(document.createTextNode('⚠️ ' + text));
+    container.scrollTop = container.scrollHeight;
+}
+
+// Applies an /api/chat response (also the "chat" event of a stream)
+function applyUpdate(form, container, data) {
+    if (data.completed && !data.messages.length) {
+        window.location.href = '/completed';
+        return;
+    }
+    if (data.reset) {
+        container.innerHTML = '';
+    }
+    data.messages.forEach((message) => appendMessage(container, message));
+    container.scrollTop = container.scrollHeight;
+    document.body.dataset.seq = data.seq;
+    if (!data.completed) {
+        document.getElementById('level').textContent = data.level;
+    }
+    showHint(form, data.hint);
+    if (data.celebrate) {
+        celebrate();
+    }
+}
+
+// Calls onEvent(name, data) for each event of a text/event-stream response;
+// heartbeat comments carry no data and are skipped
+async function readEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+        const { value, done } = await reader.read();
+        if (done) {
+            return;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let end;
+        while ((end = buffer.indexOf('\n\n')) !== -1) {
+            let name = 'message';
+            let data = '';
+            buffer.slice(0, end).split('\n').forEach((line) => {
+                if (line.startsWith('event:')) {
+                    name = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            buffer = buffer.slice(end + 2);
+            if (data) {
+                onEvent(name, JSON.parse(data));
+            }
+        }
+    }
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    const form = document.getElementById('chat-form');
+    const container = document.querySelector('.chat-container');
+    if (!form || !window.fetch) {
+        return;
+    }
+
+    if (document.body.dataset.shell === 'true') {
+        // Cached page shell: the level and history come from the session
+        fetch('/api/chat?since=0')
+            .then((response) => {
+                if (!response.ok) {
+                    throw new Error('chat request failed: ' + response.status);
+                }
+                return response.json();
+            })
+            .then((data) => {
+                if (data.completed) {
+                    window.location.href = '/completed';
+                    return;
+                }
+                applyUpdate(form, container, data);
+            })
+            .catch(() => {
+                window.location.href = '/';
+            });
+    }
+
+    const streams = !!(window.ReadableStream && window.TextDecoder);
+
+    form.addEventListener('submit', async (event) => {
+        event.preventDefault();
+        const textarea = form.elements['user_input'];
+        const button = form.querySelector('input[type=submit]');
+        const request = {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ prompt: textarea.value, since: Number(document.body.dataset.seq) }),
+        };
+        let received = false;
+        button.disabled = true;
+        try {
+            let response = null;
+            if (streams) {
+                response = await fetch('/api/chat/stream', request);
+                if ([404, 405, 503].includes(response.status)) {
+                    // No streaming here, or every stream slot of this worker is taken
+                    response = null;
+                }
+            }
+            if (!response) {
+                response = await fetch('/api/chat', request);
+            }
+            if (response.status === 429) {
+                // Rate limited: resubmitting the form would be rejected too
+                const wait = response.headers.get('Retry-After') || '1';
+                appendMessage(container, { sender: 'bot', html: '⏳ Too many prompts, please wait ' + wait + 's and try again.' });
+                container.scrollTop = container.scrollHeight;
+                return;
+            }
+            if (response.status === 404 || response.status === 405) {
+                throw new Error('no chat endpoint: ' + response.status);
+            }
+            if (!response.ok) {
+                await showError(container, response);
+                return;
+            }
+            received = true;
+
+            if (!(response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+                const data = await response.json();
+                applyUpdate(form, container, data);
+                textarea.value = '';
+                return;
+            }
+
+            let reply = null;
+            let html = '';
+            await readEvents(response, (name, data) => {
+                if (name === 'chat') {
+                    applyUpdate(form, container, data);
+                    textarea.value = '';
+                } else if (name === 'reply') {
+                    reply = appendMessage(container, { sender: data.sender, html: '' });
+                } else if (name === 'delta') {
+                    html += data.html;
+                    reply.innerHTML = '<b>Bot:</b> ' + html;
+                    container.scrollTop = container.scrollHeight;
+                } else if (name === 'done') {
+                    document.body.dataset.seq = data.seq;
+                }
+            });
+        } catch (err) {
+            if (received) {
+                window.location.href = '/';
+            } else {
+                form.submit();
+            }
+        } finally {
+            button.disabled = false;
+        }
+    });
+});
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Whitespace runs other than a single space. They collapse to one tab rather than a
+# space: keywords such as "act as" contain exactly one space, and "act\n as" must
+# not start matching them just because it was canonicalized.
+WHITESPACE_RUN = re.compile(r'(?: (?=\s)|[^\S ])\s*')
+
+HIT = 'hit'
+SHARED_HIT = 'shared_hit'
+MISS = 'miss'
+
+
+def canonicalize(prompt):
+    # Folds case and collapses whitespace without changing which keywords match
+    return WHITESPACE_RUN.sub('\t', prompt.lower())
+
+
+class VerdictCache:
+    # Bounded LRU + TTL cache of keyword verdicts keyed on (level, canonical prompt).
+    #
+    # Only values that depend on the lowercased prompt belong here; anything that
+    # looks at the original casing (SUSPICIOUS_PATTERNS) must not be cached under a
+    # case-folded key. Callers pass the version of the rules the value depends on
+    # (a level pack's "version"); it is part of every key, so reloaded level
+    # definitions never see stale verdicts and the old entries age out.
+    #
+    # With `shared_path`, misses fall through to a SQLite file that all gunicorn
+    # workers share before computing. A SQLite lookup costs more than evaluating the
+    # current keyword rules, so that tier only pays off for expensive verdicts. The
+    # file is bounded too: at most every `purge_interval` seconds per process,
+    # expired rows (which includes every row of an old version, as those are never
+    # refreshed) are deleted, then the soonest to expire beyond `shared_maxsize`.
+
+    def __init__(self, maxsize=10000, ttl=600.0, shared_path=None, shared_maxsize=100000, purge_interval=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_path = shared_path
+        self.shared_maxsize = shared_maxsize
+        self.purge_interval = purge_interval
+        self.stats = {HIT: 0, SHARED_HIT: 0, MISS: 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._next_purge = 0.0
+
+    def get_or_compute(self, version, level, prompt, compute):
+        # Returns (value, HIT | SHARED_HIT | MISS); compute() runs only on a miss
+        key = (version, level, canonicalize(prompt))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.stats[HIT] += 1
+                return entry[0], HIT
+
+        value, source = None, MISS
+        if self.shared_path:
+            value = self._shared_get(key)
+            if value is not None:
+                source = SHARED_HIT
+        if value is None:
+            value = compute()
+            if self.shared_path:
+                self._shared_put(key, value)
+
+        with self._lock:
+            self._entries[key] = (value, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self.stats[source] += 1
+        return value, source
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _connection(self):
+        # sqlite3 connections must not cross threads or a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.shared_path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, value TEXT, expires REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS verdicts_expires ON verdicts (expires)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _shared_key(self, key):
+        version, level, text = key
+        return f"{version}:{level}:" + hashlib.sha256(text.encode()).hexdigest()
+
+    def _shared_get(self, key):
+        try:
+            row = self._connection().execute(
+                'SELECT value FROM verdicts WHERE key = ? AND expires > ?', (self._shared_key(key), time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            return None # the shared tier is best effort; fall back to computing
+        return tuple(json.loads(row[0])) if row else None
+
+    def _shared_put(self, key, value):
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO verdicts (key, value, expires) VALUES (?, ?, ?)',
+                (self._shared_key(key), json.dumps(value), now + self.ttl),
+            )
+            self._purge(conn, now)
+        except sqlite3.Error:
+            pass
+
+    def _purge(self, conn, now):
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        conn.execute('DELETE FROM verdicts WHERE expires <= ?', (now,))
+        conn.execute('DELETE FROM verdicts WHERE key IN '
+                     '(SELECT key FROM verdicts ORDER BY expires LIMIT max(0, (SELECT COUNT(*) FROM verdicts) - ?))',
+                     (self.shared_maxsize,))